@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+# Compare HSV to packed RGB conversion through colorsys against the color module: one color
+# at a time, the numpy batch conversion and the hue wheel lookup. Runs off-device.
+
+import sys
+from colorsys import hsv_to_rgb
+from random import random
+from time import perf_counter
+
+import color
+
+REPEATS = 200
+COLOR_COUNTS = (5, 150, 600)
+
+
+def colorsys_packed(hues, value):
+    words = []
+    for hue in hues:
+        red, green, blue = hsv_to_rgb(hue, 1.0, value)
+        words.append((int(red * 255) << 16) | (int(green * 255) << 8) | int(blue * 255))
+    return words
+
+
+def time_repeats(func):
+    start = perf_counter()
+    for i in range(REPEATS):
+        func()
+    return (perf_counter() - start) / REPEATS
+
+
+def bench(count):
+    hues = [ random() for i in range(count) ]
+    value = .75
+
+    results = { "colorsys" : time_repeats(lambda: colorsys_packed(hues, value)),
+                "hsv_to_packed" : time_repeats(lambda: [ color.hsv_to_packed(hue, 1.0, value) for hue in hues ]) }
+
+    numpy = color.np
+    color.np = None
+    try:
+        results["hsv_batch python"] = time_repeats(lambda: color.hsv_batch(hues, 1.0, value))
+    finally:
+        color.np = numpy
+
+    if numpy is not None:
+        results["hsv_batch numpy"] = time_repeats(lambda: color.hsv_batch(hues, 1.0, value))
+        results["hue_wheel numpy"] = time_repeats(lambda: color.hue_wheel(hues, value))
+
+    return results
+
+
+if __name__ == "__main__":
+    if color.np is None:
+        print("numpy not available, only the pure python paths will be measured.", file=sys.stderr)
+
+    for count in COLOR_COUNTS:
+        results = bench(count)
+        base = results["colorsys"]
+        print("%d colors" % count)
+        for name, t in results.items():
+            print("  %-18s %9.1f us  %6.1fx" % (name, t * 1e6, base / t))
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+# Drive every registered effect for a number of frames on a strip backend that needs no hardware
+# and report what each frame costs, as JSON so runs can be compared across changes. The effects are
+# fed a simulated clock at their own FPS, so they animate the same however fast the frames go by.
+
+import sys
+import json
+import argparse
+import tracemalloc
+from random import seed
+from time import perf_counter
+
+import config
+
+FRAMES = 300
+
+# Allocations are counted in a separate, shorter pass since tracing slows everything down
+ALLOC_FRAMES = 50
+
+
+def run_frame(lips, effect, t):
+    ''' Render and show one frame, return the time spent on each '''
+
+    start = perf_counter()
+    if effect.time_based:
+        lips.render_effect(effect, t)
+        rendered = perf_counter()
+        lips.show()
+    else:
+        # Legacy effects show their own frames, so all of it counts as render time
+        effect.loop()
+        rendered = perf_counter()
+
+    return rendered - start, perf_counter() - rendered
+
+
+def bench_effect(lips, index, frames):
+    lips.activate_effect(index)
+    effect = lips.current_effect
+
+    render_total = 0.0
+    show_total = 0.0
+    frame_max = 0.0
+    blocks = sys.getallocatedblocks()
+    start = perf_counter()
+    for frame in range(frames):
+        render, show = run_frame(lips, effect, float(frame) / effect.FPS)
+        render_total += render
+        show_total += show
+        frame_max = max(frame_max, render + show)
+    elapsed = perf_counter() - start
+    blocks = sys.getallocatedblocks() - blocks
+
+    # Peak memory above what was in use before the frame, i.e. what the frame allocated
+    alloc_total = 0
+    tracemalloc.start()
+    for frame in range(frames, frames + ALLOC_FRAMES):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        run_frame(lips, effect, float(frame) / effect.FPS)
+        alloc_total += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    return { "fps" : frames / elapsed,
+             "us_per_frame" : elapsed / frames * 1e6,
+             "render_us" : render_total / frames * 1e6,
+             "show_us" : show_total / frames * 1e6,
+             "max_frame_us" : frame_max * 1e6,
+             "alloc_bytes_per_frame" : alloc_total / ALLOC_FRAMES,
+             "blocks_per_frame" : float(blocks) / frames }
+
+
+def bench(backend, frames, names=None):
+    import lips
+
+    a = lips.Lips(backend)
+    lips.add_effects(a)
+
+    # We're after the wire time, keeping the frames would only show up as allocations
+    for strip in a.strips:
+        strip.max_frames = 0
+    a.apply_brightness(100)
+
+    results = {}
+    for index, effect in enumerate(a.effect_list):
+        if names and effect.name not in names:
+            continue
+        seed(0)
+        results[effect.name] = bench_effect(a, index, frames)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Lips effects without any LED hardware.")
+    parser.add_argument("--frames", type=int, default=FRAMES, help="frames to render for each effect")
+    parser.add_argument("--backend", default="recording", choices=("null", "recording"))
+    parser.add_argument("--leds", type=int, help="number of LEDs per strip, instead of config.NUM_LEDS")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("effects", nargs="*", help="only benchmark these effects")
+    args = parser.parse_args()
+
+    if args.leds:
+        config.NUM_LEDS = args.leds
+
+    import gradient
+    report = { "backend" : args.backend,
+               "num_leds" : config.NUM_LEDS,
+               "frames" : args.frames,
+               "numpy" : gradient.np is not None,
+               "effects" : bench(args.backend, args.frames, args.effects) }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=4, sort_keys=True))
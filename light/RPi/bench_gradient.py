@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+# Compare the old per-LED gradient render path against the whole frame render_frame() path.
+# Runs off-device: no strips are needed, the per-LED path writes into a plain list.
+
+import sys
+from math import fmod
+from time import perf_counter
+
+import gradient
+
+FRAMES = 200
+LED_COUNTS = (150, 300, 600)
+
+PALETTE = [ (0.0, (255, 0, 0)),
+            (0.2, (210, 70, 0)),
+            (0.45, (128, 0, 128)),
+            (0.65, (0, 60, 255)),
+            (0.8, (210, 70, 0)),
+            (1.0, (255, 0, 0)) ]
+
+
+class ListLedArt(object):
+
+    def __init__(self, num_leds):
+        self.leds = [0] * num_leds
+
+    def set_led_color(self, led, col, channel):
+        self.leds[led] = (col[1] << 16) | (col[0] << 8) | col[2]
+
+
+def linear_color_by_offset(palette, offset):
+    # The original Gradient.get_color_by_offset(): a linear scan of the palette
+    if offset < 0.0 or offset > 1.0:
+        raise IndexError("Invalid offset.")
+
+    for index in range(1, len(palette)):
+        if palette[index][0] >= offset:
+            section_begin_offset = palette[index-1][0]
+            section_end_offset = palette[index][0]
+
+            percent = (offset - section_begin_offset) / (section_end_offset - section_begin_offset)
+            new_color = []
+            for color in range(3):
+                new_color.append(int(palette[index-1][1][color] +
+                        ((palette[index][1][color] - palette[index-1][1][color]) * percent)))
+
+            return (min(new_color[0], 255), min(new_color[1], 255), min(new_color[2], 255))
+
+    assert False
+
+
+def render_per_led(g, led_art):
+    # The original Gradient.render(): one palette scan and one set_led_color() per LED
+    for led in range(g.num_leds):
+        offset = fmod((float(led) / float(g.num_leds - 1)) + g.led_offset / g.led_scale, 1.0)
+        led_art.set_led_color(led, linear_color_by_offset(g.palette, offset), 2)
+
+
+def time_frames(func):
+    start = perf_counter()
+    for i in range(FRAMES):
+        func()
+    return (perf_counter() - start) / FRAMES
+
+
+def bench(num_leds):
+    g = gradient.Gradient(PALETTE, num_leds)
+    g.set_scale(2.0)
+    g.set_offset(.3)
+    led_art = ListLedArt(num_leds)
+
+    results = { "per led render": time_frames(lambda: render_per_led(g, led_art)) }
+
+    numpy = gradient.np
+    gradient.np = None
+    try:
+        results["render_frame python"] = time_frames(g.render_frame)
+    finally:
+        gradient.np = numpy
+
+    if numpy is not None:
+        results["render_frame numpy"] = time_frames(g.render_frame)
+
+    # Repeated palettes: after the first frame this is a cache lookup
+    results["lut cache"] = time_frames(lambda: gradient.lut_cache.get(PALETTE, num_leds))
+
+    return results
+
+
+if __name__ == "__main__":
+    if gradient.np is None:
+        print("numpy not available, only the pure python path will be measured.", file=sys.stderr)
+
+    for num_leds in LED_COUNTS:
+        results = bench(num_leds)
+        base = results["per led render"]
+        print("NUM_LEDS %d" % num_leds)
+        for name, t in results.items():
+            print("  %-22s %9.1f us/frame  %6.1fx" % (name, t * 1e6, base / t))
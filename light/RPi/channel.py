@@ -0,0 +1,102 @@
+from copy import deepcopy
+from time import monotonic
+
+from framebuffer import FrameBuffer, pack
+from renderer import EffectRenderer
+
+
+class ChannelEffect(object):
+    '''
+        An effect that runs on its own, for one channel or for both channels if they show the
+        same thing. It renders into its own framebuffer on its own clock, at the effect's FPS.
+
+        The effect is a copy of the one registered with Lips, with this object as its led_art,
+        so the same effect can run on both channels with different settings.
+
+        fps overrides the effect's own frame rate. At 0 the effect is static: it is only rendered
+        again after it has been cleared or changed. Given a start time, the effect isn't set up
+        again but carries on from where it is, on the clock it has been running on since start.
+    '''
+
+    def __init__(self, effect, index, num_leds, cache_bytes, full_redraw_frames, fps=None, start=None):
+        self.effect_index = index
+        self.frame = FrameBuffer(num_leds)
+        self.draw_frames = [ self.frame ]
+        self.renderer = EffectRenderer(self, num_leds, cache_bytes, full_redraw_frames)
+
+        # Copy everything but the led_art, which becomes us
+        self.effect = deepcopy(effect, { id(effect.led_art) : self })
+        if start is None:
+            self.effect.setup()
+            start = monotonic()
+        self.start = start
+        self.next_frame = self.start
+        self.fps = self.effect.FPS if fps is None else fps
+        self.period = 1.0 / self.fps if self.fps else None
+
+
+    @property
+    def name(self):
+        return self.effect.name
+
+
+    def set_color(self, col, channel=None):
+        self.frame.fill(pack(col))
+
+
+    def set_led_color(self, led, col, channel=None):
+        self.frame.pixels[led] = pack(col)
+
+
+    def set_frame(self, frame, channel=None):
+        self.frame.set_frame(frame)
+
+
+    def show(self, channel=None):
+        ''' Lips shows our frame, this is only here for effects that still call show() themselves '''
+        pass
+
+
+    def clear(self):
+        self.frame.fill(0)
+        self.renderer.scroll_dirty = True
+        self.redraw()
+
+
+    def set_effect_color(self, color):
+        self.effect.set_color(color)
+        self.renderer.invalidate()
+        self.redraw()
+
+
+    def nudge(self):
+        self.effect.nudge()
+        self.renderer.invalidate()
+        self.redraw()
+
+
+    def redraw(self):
+        ''' Something changed, so a static effect needs rendering again '''
+        if not self.period:
+            self.next_frame = self.start
+
+
+    def due(self, now):
+        return now >= self.next_frame
+
+
+    def render(self, now):
+        ''' Render the frame for now and work out when the next one is due, skipping any we missed '''
+
+        if self.effect.time_based:
+            self.renderer.render(self.effect, now - self.start)
+        else:
+            self.effect.loop()
+
+        if not self.period:
+            self.next_frame = float("inf")
+            return
+
+        self.next_frame += self.period
+        if self.next_frame <= now:
+            self.next_frame = now + self.period
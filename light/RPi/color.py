@@ -0,0 +1,107 @@
+from array import array
+from colorsys import hsv_to_rgb as _colorsys_hsv_to_rgb, rgb_to_hsv as _colorsys_rgb_to_hsv
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Entries in the hue wheel. Neighbouring entries are less than one step of 255 apart.
+HUE_STEPS = 4096
+
+
+def _wheel_color(hue):
+    ''' Fully saturated color at hue, as floats scaled to 0.0 - 255.0 '''
+    red, green, blue = _colorsys_hsv_to_rgb(hue, 1.0, 1.0)
+    return (red * 255.0, green * 255.0, blue * 255.0)
+
+
+# Fully saturated, full value colors around the wheel, the last entry is the same as the first
+HUE_WHEEL = [ _wheel_color(float(i) / HUE_STEPS) for i in range(HUE_STEPS + 1) ]
+
+if np is not None:
+    _hue_wheel = np.array(HUE_WHEEL, dtype=np.float64)
+
+
+def hsv_to_rgb(hue, saturation = 1.0, value = 1.0):
+    ''' Convert to an (r, g, b) tuple of 0 - 255 ints. Hue wraps around, so anything goes.
+        Fully saturated colors, the most common kind here, come from the hue wheel. '''
+
+    if saturation == 1.0:
+        red, green, blue = HUE_WHEEL[int((hue % 1.0) * HUE_STEPS + .5)]
+        return (int(red * value), int(green * value), int(blue * value))
+
+    red, green, blue = _colorsys_hsv_to_rgb(hue % 1.0, saturation, value)
+    return (int(red * 255), int(green * 255), int(blue * 255))
+
+
+def hsv_to_packed(hue, saturation = 1.0, value = 1.0):
+    if saturation == 1.0:
+        red, green, blue = HUE_WHEEL[int((hue % 1.0) * HUE_STEPS + .5)]
+        return (int(red * value) << 16) | (int(green * value) << 8) | int(blue * value)
+
+    red, green, blue = hsv_to_rgb(hue, saturation, value)
+    return (red << 16) | (green << 8) | blue
+
+
+def rgb_to_hsv(color):
+    ''' (r, g, b) tuple of 0 - 255 ints to hue, saturation and value from 0.0 to 1.0 '''
+    return _colorsys_rgb_to_hsv(color[0] / 255.0, color[1] / 255.0, color[2] / 255.0)
+
+
+def hsv_batch(hues, saturations = 1.0, values = 1.0):
+    ''' Convert many colors at once, to packed 0xRRGGBB words. Saturations and values can be
+        sequences the same length as hues or a single number for all of them. Returns a numpy
+        uint32 array if numpy is available, otherwise an array('I'). '''
+
+    if np is None:
+        return _hsv_batch_python(hues, saturations, values)
+
+    hues, saturations, values = np.broadcast_arrays(np.mod(np.asarray(hues, dtype=np.float64), 1.0),
+                                                    np.asarray(saturations, dtype=np.float64),
+                                                    np.asarray(values, dtype=np.float64))
+
+    # Same as colorsys: which sixth of the wheel we're in and how far along it
+    sixth = hues * 6.0
+    index = sixth.astype(np.int64) % 6
+    f = sixth - np.floor(sixth)
+    p = values * (1.0 - saturations)
+    q = values * (1.0 - saturations * f)
+    t = values * (1.0 - saturations * (1.0 - f))
+
+    red = np.choose(index, (values, q, p, p, t, values))
+    green = np.choose(index, (t, values, values, q, p, p))
+    blue = np.choose(index, (p, p, t, values, values, q))
+
+    return _pack(red * 255.0, green * 255.0, blue * 255.0)
+
+
+def hue_wheel(hues, values = 1.0):
+    ''' Like hsv_batch() for fully saturated colors, looked up in the hue wheel '''
+
+    if np is None:
+        return _hsv_batch_python(hues, 1.0, values)
+
+    index = (np.mod(np.asarray(hues, dtype=np.float64), 1.0) * HUE_STEPS + .5).astype(np.intp)
+    rgb = _hue_wheel[index]
+    if not np.isscalar(values) or values != 1.0:
+        rgb = rgb * np.asarray(values, dtype=np.float64)[..., np.newaxis]
+
+    return _pack(rgb[..., 0], rgb[..., 1], rgb[..., 2])
+
+
+def _pack(red, green, blue):
+    return ((np.minimum(red, 255.0).astype(np.uint32) << 16) |
+            (np.minimum(green, 255.0).astype(np.uint32) << 8) |
+            np.minimum(blue, 255.0).astype(np.uint32))
+
+
+def _hsv_batch_python(hues, saturations, values):
+
+    count = len(hues)
+    if not isinstance(saturations, (list, tuple, array)):
+        saturations = [ saturations ] * count
+    if not isinstance(values, (list, tuple, array)):
+        values = [ values ] * count
+
+    return array('I', [ hsv_to_packed(hue, saturation, value) for hue, saturation, value in zip(hues, saturations, values) ])
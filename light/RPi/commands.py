@@ -0,0 +1,322 @@
+import abc
+import sys
+import json
+import traceback
+from queue import Queue, Full, Empty
+from time import monotonic, time
+
+from metrics import Histogram
+
+COMMAND_QUEUE_SIZE = 64
+
+
+class Command(object):
+    '''
+        Something the MQTT thread wants done to the lights. Commands are created on the network
+        thread and only ever applied by the render loop, between frames.
+
+        Commands that share a COALESCE key are last-writer-wins: if several arrive within one
+        frame, only the last one is applied.
+    '''
+
+    COALESCE = None
+
+    def __init__(self, received=None):
+        self.received = received if received is not None else monotonic()
+
+    @abc.abstractmethod
+    def apply(self, lips):
+        pass
+
+
+class TurnOn(Command):
+
+    def apply(self, lips):
+        lips.turn_on()
+
+
+class TurnOff(Command):
+
+    def apply(self, lips):
+        lips.turn_off()
+
+
+class Toggle(Command):
+
+    def apply(self, lips):
+        if lips.brightness:
+            lips.turn_off()
+        else:
+            lips.turn_on()
+
+
+class SetBrightness(Command):
+
+    COALESCE = "brightness"
+
+    def __init__(self, brightness, duration=0.0, received=None):
+        Command.__init__(self, received)
+        self.brightness = brightness
+        self.duration = duration
+
+    def apply(self, lips):
+        lips.set_brightness(self.brightness, self.duration)
+
+
+class BrightnessUp(Command):
+
+    def apply(self, lips):
+        lips.brightness_up()
+
+
+class BrightnessDown(Command):
+
+    def apply(self, lips):
+        lips.brightness_down()
+
+
+class SetColor(Command):
+
+    COALESCE = "color"
+
+    def __init__(self, color, payload, received=None):
+        Command.__init__(self, received)
+        self.color = color
+        self.payload = payload
+
+    def apply(self, lips):
+        lips.set_effect_color(self.color, self.payload)
+
+
+class SetEffect(Command):
+    ''' Switch both channels to an effect, or just the one channel if given '''
+
+    def __init__(self, name, brightness=None, color=None, received=None, channel=None):
+        Command.__init__(self, received)
+        self.name = name
+        self.brightness = brightness
+        self.color = color
+        self.channel = channel
+
+    def apply(self, lips):
+        if self.channel is None:
+            lips.set_effect(self.name, self.brightness, self.color)
+        else:
+            lips.set_channel_effect(self.channel, self.name, self.color)
+
+
+class NextEffect(Command):
+
+    def apply(self, lips):
+        lips.next_effect()
+
+
+class PreviousEffect(Command):
+
+    def apply(self, lips):
+        lips.previous_effect()
+
+
+class NudgeEffect(Command):
+
+    def apply(self, lips):
+        lips.nudge_effect()
+
+
+class SetMetrics(Command):
+
+    def __init__(self, enabled, received=None):
+        Command.__init__(self, received)
+        self.enabled = enabled
+
+    def apply(self, lips):
+        lips.set_metrics(self.enabled)
+
+
+class SetLayers(Command):
+
+    def __init__(self, specs, received=None):
+        Command.__init__(self, received)
+        self.specs = specs
+
+    def apply(self, lips):
+        lips.set_layers(self.specs)
+
+
+# Commands that can be named in a dimmer/button mapping without any arguments
+SIMPLE_COMMANDS = {
+    "turn_on" : TurnOn,
+    "turn_off" : TurnOff,
+    "toggle" : Toggle,
+    "brightness_up" : BrightnessUp,
+    "brightness_down" : BrightnessDown,
+    "next_effect" : NextEffect,
+    "previous_effect" : PreviousEffect,
+    "nudge" : NudgeEffect
+}
+
+
+def make_action(spec):
+    '''
+        Turn an action from a button mapping into a function that creates its command. An action is
+        either the name of one of the SIMPLE_COMMANDS, or a dict that switches to an "effect" (with
+        optional "brightness" and "color") or sets a "brightness" (with optional fade "duration").
+    '''
+
+    if isinstance(spec, str):
+        try:
+            cls = SIMPLE_COMMANDS[spec]
+        except KeyError:
+            raise ValueError("Unknown action %s" % spec)
+        return lambda received: cls(received)
+
+    if "effect" in spec:
+        color = tuple(spec["color"]) if spec.get("color") else None
+        return lambda received: SetEffect(spec["effect"], spec.get("brightness"), color, received)
+
+    if "brightness" in spec:
+        return lambda received: SetBrightness(spec["brightness"], spec.get("duration", 0.0), received)
+
+    raise ValueError("Unknown action %s" % spec)
+
+
+class CommandQueue(object):
+    '''
+        Bounded hand off from the MQTT thread to the render loop. Tracks how long commands
+        took from arriving to the first frame that was shown after they were applied, per
+        type of command, and optionally logs each one to a trace file as a line of JSON.
+    '''
+
+    def __init__(self, size=COMMAND_QUEUE_SIZE, wake=None, wake_idle=None):
+        self.queue = Queue(size)
+        self.wake = wake
+        self.wake_idle = wake_idle
+
+        self.commands_applied = 0
+        self.commands_dropped = 0
+        self.commands_coalesced = 0
+        self.latency_count = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latencies = {}
+        self.trace = None
+
+        # Applied commands waiting for a frame to be shown, at most as many as the queue holds
+        self.size = size
+        self.unshown = []
+
+
+    def trace_to(self, path):
+        if self.trace:
+            self.trace.close()
+        self.trace = open(path, "a", buffering=1) if path else None
+
+
+    def put(self, command):
+        try:
+            self.queue.put_nowait(command)
+        except Full:
+            self.commands_dropped += 1
+            print("command queue full, dropping %s" % command.__class__.__name__)
+            return False
+
+        # Coalescable commands wait for the next frame so that a flood of them collapses into one
+        if command.COALESCE:
+            if self.wake_idle:
+                self.wake_idle()
+        elif self.wake:
+            self.wake()
+
+        return True
+
+
+    def pending(self):
+        return not self.queue.empty()
+
+
+    def drain(self):
+        commands = []
+        while True:
+            try:
+                commands.append(self.queue.get_nowait())
+            except Empty:
+                return commands
+
+
+    def apply(self, lips):
+        ''' Apply everything that is waiting, in the order it arrived, skipping coalescable commands
+            that were superseded by a later one of the same kind. Returns the commands that were
+            applied, which are also kept until frame_shown() is called. '''
+
+        commands = self.drain()
+        applied = []
+
+        last = {}
+        for i, command in enumerate(commands):
+            if command.COALESCE:
+                last[command.COALESCE] = i
+
+        for i, command in enumerate(commands):
+            if command.COALESCE and last[command.COALESCE] != i:
+                self.commands_coalesced += 1
+                continue
+
+            try:
+                command.apply(lips)
+            except Exception:
+                traceback.print_exc(file=sys.stdout)
+            self.commands_applied += 1
+            applied.append(command)
+
+        self.unshown.extend(applied)
+        del self.unshown[:-self.size]
+        return applied
+
+
+    def frame_shown(self, now=None):
+        ''' Record command to frame latency for the commands applied since the last frame was shown.
+            Call right after a frame has gone out to the strips, or right after apply() if the
+            strips are dark, so that commands don't wait for the lights to come back on. '''
+
+        commands = self.unshown
+        if not commands:
+            return
+        self.unshown = []
+
+        if now is None:
+            now = monotonic()
+
+        for command in commands:
+            latency = now - command.received
+            self.latency_total += latency
+            if latency > self.latency_max:
+                self.latency_max = latency
+
+            name = command.__class__.__name__
+            histogram = self.latencies.get(name)
+            if histogram is None:
+                histogram = self.latencies[name] = Histogram()
+            histogram.add(latency)
+
+            if self.trace:
+                self.trace.write(json.dumps({ "time" : round(time() - (now - command.received), 6),
+                                              "command" : name,
+                                              "latency_ms" : round(latency * 1000.0, 3) }) + "\n")
+
+        self.latency_count += len(commands)
+
+
+    def latency_summary(self):
+        ''' Latency histograms per type of command since the last call '''
+
+        summary = { name : histogram.summary() for name, histogram in self.latencies.items() }
+        self.latencies = {}
+        return summary
+
+
+    def stats(self):
+        return { "applied" : self.commands_applied,
+                 "dropped" : self.commands_dropped,
+                 "coalesced" : self.commands_coalesced,
+                 "latency_avg" : self.latency_total / self.latency_count if self.latency_count else 0.0,
+                 "latency_max" : self.latency_max }
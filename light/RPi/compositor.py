@@ -0,0 +1,169 @@
+from framebuffer import FrameBuffer
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# How a layer's color combines with the color of what is under it, per color channel
+BLEND_MODES = ("add", "multiply", "alpha", "max", "mix")
+
+
+def blend_channel(mode, under, over):
+    ''' One 8 bit color channel of over blended onto under, at full opacity '''
+
+    if mode == "add":
+        return min(under + over, 255)
+    if mode == "multiply":
+        return (under * over + 127) // 255
+    if mode == "max":
+        return max(under, over)
+    return over
+
+
+def coverage(word):
+    ''' How much of the LED a packed layer color covers, from 0 to 256: its brightest channel '''
+    alpha = max((word >> 16) & 0xFF, (word >> 8) & 0xFF, word & 0xFF)
+    return alpha + (alpha >> 7)
+
+
+def blend(mode, dest, layer, opacity=1.0):
+    ''' Blend layer onto dest, both FrameBuffers, in place. Opacity mixes between dest as it was
+        and the fully blended color. With "mix" the layer is drawn over dest, so opacity crossfades
+        between the two.
+
+        "alpha" treats the layer as premultiplied by its coverage, taken from each LED's brightest
+        channel: off LEDs let dest through, full brightness ones hide it and dimmer ones, like a
+        fading trail, are laid over dest in proportion. '''
+
+    scale = int(min(max(opacity, 0.0), 1.0) * 256.0 + .5)
+    if not scale:
+        return
+
+    if np is None:
+        _blend_python(mode, dest, layer, scale)
+        return
+
+    # Work on the bytes of the packed words, which puts each color channel in its own column
+    out = dest.pixels.view(np.uint8).reshape(-1, 4)
+    under = out.astype(np.int32)
+    over = layer.pixels.view(np.uint8).reshape(-1, 4).astype(np.int32)
+
+    if mode == "alpha":
+        alpha = over.max(axis=1)
+        alpha += alpha >> 7
+        alpha *= scale
+        alpha >>= 8
+        over *= scale
+        over >>= 8
+        under *= (256 - alpha)[:, np.newaxis]
+        under >>= 8
+        under += over
+        np.minimum(under, 255, out=under)
+        out[:] = under
+        return
+
+    if mode == "add":
+        blended = np.minimum(under + over, 255)
+    elif mode == "multiply":
+        blended = (under * over + 127) // 255
+    elif mode == "max":
+        blended = np.maximum(under, over)
+    else:
+        blended = over
+
+    if scale == 256:
+        out[:] = blended
+        return
+
+    blended -= under
+    blended *= scale
+    blended >>= 8
+    blended += under
+    out[:] = blended
+
+
+def _blend_python(mode, dest, layer, scale):
+
+    pixels = dest.pixels
+    for led, over in enumerate(layer.pixels):
+        under = pixels[led]
+        word = 0
+
+        if mode == "alpha":
+            if not over:
+                continue
+            alpha = (coverage(over) * scale) >> 8
+            for shift in (16, 8, 0):
+                u = (under >> shift) & 0xFF
+                o = (((over >> shift) & 0xFF) * scale) >> 8
+                word |= min(o + ((u * (256 - alpha)) >> 8), 255) << shift
+            pixels[led] = word
+            continue
+
+        for shift in (16, 8, 0):
+            u = (under >> shift) & 0xFF
+            b = blend_channel(mode, u, (over >> shift) & 0xFF)
+            word |= (u + (((b - u) * scale) >> 8)) << shift
+        pixels[led] = word
+
+
+class Layer(object):
+    '''
+        An effect drawn on top of what the channels show. The effect is a ChannelEffect, so it
+        renders into its own framebuffer at its own frame rate.
+    '''
+
+    def __init__(self, channel_effect, mode="max", opacity=1.0):
+        if mode not in BLEND_MODES:
+            raise ValueError("Unknown blend mode %s" % mode)
+
+        opacity = float(opacity)
+        if not 0.0 <= opacity <= 1.0:
+            raise ValueError("Opacity must be from 0.0 to 1.0")
+
+        self.channel_effect = channel_effect
+        self.mode = mode
+        self.opacity = opacity
+
+
+    @property
+    def name(self):
+        return self.channel_effect.name
+
+
+    @property
+    def frame(self):
+        return self.channel_effect.frame
+
+
+    def state(self):
+        return { "effect" : self.name,
+                 "blend" : self.mode,
+                 "opacity" : self.opacity,
+                 "fps" : self.channel_effect.fps }
+
+
+class Compositor(object):
+    '''
+        Blends layers, bottom to top, onto a channel's frame on its way out. Each channel has its
+        own buffer to compose into, so both strips can be composed at the same time.
+    '''
+
+    def __init__(self, num_leds):
+        self.layers = []
+        self.frames = [ FrameBuffer(num_leds), FrameBuffer(num_leds) ]
+
+
+    def compose(self, source, index):
+        ''' Return source with all the layers blended on top, or source itself if there are none '''
+
+        if not self.layers:
+            return source
+
+        frame = self.frames[index]
+        frame.set_frame(source.pixels)
+        for layer in self.layers:
+            blend(layer.mode, frame, layer.frame, layer.opacity)
+
+        return frame
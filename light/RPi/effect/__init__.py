@@ -1,8 +1,25 @@
 import abc
 
+import config
+
 
 class Effect(object):
 
+    # Frames per second the render loop should draw this effect at. Per frame amounts in the
+    # effects, like a fade or a distance to move, are per frame at this rate: render() scales them
+    # by the frames' worth of time that went by, so the speed doesn't depend on the real frame rate.
+    FPS = 30
+
+    # Effects that loop through a fixed number of distinct frames set this to that number. The
+    # engine then renders the cycle once and replays it from a frame cache, until the effect's
+    # color is changed or it is nudged.
+    PERIODIC_FRAMES = None
+
+    # Effects that slide a pattern along the strip set this and implement scroll() and
+    # render_pixels(). The engine then moves the last frame along and only renders the LEDs
+    # that scrolled into view, with a full redraw every so often.
+    SCROLLING = False
+
     def __init__(self, led_art, name):
         self.led_art = led_art
         self.effect_name = name
@@ -27,7 +44,44 @@ class Effect(object):
     def reset(self):
         pass
 
+    @property
+    def time_based(self):
+        return self.SCROLLING or type(self).render is not Effect.render
+
     @abc.abstractmethod
     def loop(self):
+        ''' Legacy contract: advance the effect by one frame, draw it and call show() '''
+        pass
+
+    def frame_index(self, t):
+        ''' For periodic effects, which frame of the cycle is showing at time t. The cycle steps at
+            FPS frames per second however often render() gets called, so there are only
+            PERIODIC_FRAMES distinct frames, and anything derived from the index can be cached. '''
+        return int(t * self.FPS) % self.PERIODIC_FRAMES
+
+    @abc.abstractmethod
+    def scroll(self, t):
+        ''' Scrolling effects: move on to time t and return how many LEDs the pattern moved towards
+            the end of the strip since the last call. This can be fractional or negative. '''
+        pass
+
+    @abc.abstractmethod
+    def render_pixels(self, start, end, pixel_shift=0.0):
+        ''' Scrolling effects: return the packed colors of LEDs start to end - 1, sampled as if each
+            LED were pixel_shift LEDs further along the strip '''
         pass
 
+    def render(self, t):
+        ''' Draw the frame for time t, in seconds since setup(). The engine calls show(), so
+            frames can be dropped under load without changing the speed of the animation.
+            Effects that don't scroll override this, or implement the legacy loop() instead. '''
+
+        if not self.SCROLLING:
+            return
+
+        self.scroll(t)
+        try:
+            self.led_art.set_frame(self.render_pixels(0, config.NUM_LEDS), 2)
+        except (ValueError, IndexError):
+            pass
+
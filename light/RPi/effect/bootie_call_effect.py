@@ -1,16 +1,15 @@
 from random import random
 from math import sin, pi
-from time import sleep
-from colorsys import hsv_to_rgb, rgb_to_hsv, rgb_to_hsv
 from gamma import GAMMA_TABLE
 
-import palette
+import color as colors
 import effect
 
 
 class BootieCallEffect(effect.Effect):
 
     NAME = "bootiecall"
+    FPS = 100
 
     def __init__(self, led_art, value_increment = .01, gamma_correct = False):
         effect.Effect.__init__(self, led_art, self.NAME)
@@ -21,6 +20,7 @@ class BootieCallEffect(effect.Effect):
     def setup(self):
         self.hue = random()
         self.value = 0.0
+        self.pulse = 0
         self.next_color = None
 
 
@@ -28,25 +28,24 @@ class BootieCallEffect(effect.Effect):
         self.next_color = color
 
 
-    def loop(self):
+    def render(self, t):
 
-        value = (sin(self.value * pi * 2.0) + 1.0) / 6.0
-        color = palette.make_hsv(self.hue, 1.0, value)
-
-        if self.gamma_correct:
-            color = (GAMMA_TABLE[color[0]], GAMMA_TABLE[color[1]], GAMMA_TABLE[color[2]])
-
-        self.led_art.set_color(color)
-        self.led_art.show()
-        sleep(.001)
+        self.value = t * self.value_increment * self.FPS
 
-        if value < .0000001:
+        # The pulse is dark at .75 of each cycle, which is when we pick the next hue
+        pulse = int(self.value + .25)
+        if pulse != self.pulse:
+            self.pulse = pulse
             if not self.next_color:
                 self.hue = random()
             else:
-                self.hue, s, v = rgb_to_hsv(float(self.next_color[0]) / 255, 
-                       float(self.next_color[1]) / 255,
-                       float(self.next_color[2]) / 255)
+                self.hue, s, v = colors.rgb_to_hsv(self.next_color)
                 self.next_color = None
 
-        self.value += self.value_increment
+        value = (sin(self.value * pi * 2.0) + 1.0) / 6.0
+        color = colors.hsv_to_rgb(self.hue, 1.0, value)
+
+        if self.gamma_correct:
+            color = (GAMMA_TABLE[color[0]], GAMMA_TABLE[color[1]], GAMMA_TABLE[color[2]])
+
+        self.led_art.set_color(color)
@@ -13,6 +13,7 @@ DEFAULT_COLORS = [(255, 0, 0), (210, 70, 0)]
 class ChillBedTimeEffect(effect.Effect):
 
     NAME = "bedtime"
+    PERIODIC_FRAMES = 40
 
     def __init__(self, led_art):
         effect.Effect.__init__(self, led_art, self.NAME)
@@ -21,7 +22,7 @@ class ChillBedTimeEffect(effect.Effect):
         self.colors = copy(DEFAULT_COLORS)
         self.color_index = 0
         self.uoap_index = 0
-        self.uaop_steps = 40
+        self.uaop_steps = self.PERIODIC_FRAMES
         self.uoap_increment = 1.0 / self.uaop_steps 
 
     def reset(self):
@@ -35,19 +36,12 @@ class ChillBedTimeEffect(effect.Effect):
         self.color_index = (self.color_index + 1) % 2
 
 
-    def loop(self):
-        t = self.uoap_index * 2 * pi
-        jitter = sin(t) / 4
+    def render(self, t):
+        self.uoap_index = self.frame_index(t) * self.uoap_increment
+        jitter = sin(self.uoap_index * 2 * pi) / 4
         p = [ (0.0, self.colors[0]), 
               (0.45 + jitter, self.colors[1]),
               (0.65 + jitter, self.colors[1]),
               (1.0, self.colors[0])
         ]
-        g = gradient.Gradient(p, config.NUM_LEDS)
-        g.render(self.led_art, CHANNEL_BOTH)
-
-        self.led_art.show()
-
-        self.uoap_index += self.uoap_increment
-        if self.uoap_index > 1.0:
-            self.uoap_index = 0.0
+        self.led_art.set_frame(gradient.lut_cache.get(p, config.NUM_LEDS), CHANNEL_BOTH)
@@ -1,7 +1,6 @@
 import math
 from random import random, randint, seed
 from math import fmod, sin, pi
-from time import sleep, time
 from colorsys import hsv_to_rgb, rgb_to_hsv, rgb_to_hsv
 
 import config
@@ -13,10 +12,12 @@ import effect
 class ColorCycleEffect(effect.Effect):
 
     NAME = "color cycle"
+    FPS = 30
+    SCROLLING = True
 
     def __init__(self, led_art):
         effect.Effect.__init__(self, led_art, self.NAME)
-        self.palette = []
+        self.gradient = gradient.ScrollingGradient()
         self.point_distance = .25
         self.render_increment = .01
 
@@ -26,43 +27,38 @@ class ColorCycleEffect(effect.Effect):
         self.source = list(palette.create_random_palette())
         self.source_index = 0
         self.num_new_points = 0
-        self.palette = []
+        self.gradient = gradient.ScrollingGradient()
         for i in range(len(self.source) + 1):
-            self.palette.append( [ float(i) / len(self.source), self.source[self.source_index] ] )
+            self.gradient.push_back(float(i) / len(self.source), self.source[self.source_index])
             self.source_index = (self.source_index + 1) % len(self.source)
 
+        self.last_t = 0.0
+
     def set_color(self, color):
         self.source = palette.create_triad_palette(color)
         self.source_index = 0
 
 
-    def loop(self):
+    def scroll(self, t):
 
-        try:
-            g = gradient.Gradient(config.NUM_LEDS, self.palette)
-            g.render(self.led_art) 
-            self.led_art.show()
-        except ValueError as err:
-            pass
+        increment = max(t - self.last_t, 0.0) * self.render_increment * self.FPS
+        self.last_t = t
 
         # Move all the points down a smidge
-        for i in range(len(self.palette)):
-            self.palette[i] = [ self.palette[i][0] + self.render_increment, self.palette[i][1] ]
+        g = self.gradient
+        g.scroll(increment)
 
         # Has my closest point gone over 0.0? Time to insert a new point!
-        if self.palette[0][0] > 0.0:
-            self.palette.insert(0, [ self.palette[0][0] - self.point_distance, self.source[self.source_index]])
+        while g.position(0) > 0.0:
+            g.push_front(g.position(0) - self.point_distance, self.source[self.source_index])
             self.source_index = (self.source_index + 1) % len(self.source)
         
             if not self.source:
                 self.source = list(palette.create_random_palette())
 
             # clean up the point(s) that went out the other end
-            try:
-                while self.palette[-2][0] > 1.0:
-                    self.palette.pop()
-            except IndexError:
-                pass
+            while len(g) > 2 and g.position(-2) > 1.0:
+                g.pop_back()
 
             if self.num_new_points == 10:
                 self.source = list(palette.create_random_palette())
@@ -71,4 +67,8 @@ class ColorCycleEffect(effect.Effect):
 
             self.num_new_points += 1
 
-        sleep(.03)
+        return increment * (config.NUM_LEDS - 1)
+
+
+    def render_pixels(self, start, end, pixel_shift=0.0):
+        return self.gradient.render_pixels(config.NUM_LEDS, start, end, pixel_shift)
@@ -1,7 +1,7 @@
 import math
+from collections import deque
 from random import random, randint, seed, uniform
 from math import fmod, sin, pi
-from time import sleep, time
 from colorsys import hsv_to_rgb, rgb_to_hsv, rgb_to_hsv
 
 import config
@@ -13,6 +13,8 @@ import effect
 class DynamicColorCycleEffect(effect.Effect):
 
     NAME = "dynamic"
+    FPS = 60
+    SCROLLING = True
 
     # variables
     COLOR_CYCLE_REPETITIONS = 15
@@ -20,7 +22,7 @@ class DynamicColorCycleEffect(effect.Effect):
 
     def __init__(self, led_art):
         effect.Effect.__init__(self, led_art, self.NAME)
-        self.palette = []
+        self.gradient = gradient.ScrollingGradient()
         self.direction = 1
 
 
@@ -30,16 +32,24 @@ class DynamicColorCycleEffect(effect.Effect):
             self.source.extend(base_source)
 
 
+    def next_source_color(self):
+        color = self.source.popleft()
+        if not self.source:
+            self.fill_source()
+        return color
+
+
     def setup(self):
-        self.source = []
-        self.palette = []
+        self.source = deque()
 
         self.fill_source()
         self.point_distance = 1.0 / len(self.source)
+        self.gradient = gradient.ScrollingGradient()
         for i in range(len(self.source)):
-            self.palette.append( [ self.get_point_distance() * i , self.source.pop(0) ] )
+            self.gradient.push_back(self.get_point_distance() * i, self.source.popleft())
 
         self.fill_source()
+        self.last_t = 0.0
 
 
     def set_color(self, color):
@@ -49,12 +59,6 @@ class DynamicColorCycleEffect(effect.Effect):
         pass
 
 
-    def move_points(self, increment):
-        # Move all the points down a smidge
-        for i in range(len(self.palette)):
-            self.palette[i] = [ self.palette[i][0] + increment, self.palette[i][1] ]
-
-
     def print_palette(self, palette):
 
         for d, color in palette:
@@ -66,35 +70,28 @@ class DynamicColorCycleEffect(effect.Effect):
         return uniform(self.point_distance / 2.0, self.point_distance)
 
 
-    def loop(self):
+    def scroll(self, t):
 
-        try:
-            g = gradient.Gradient(self.palette, config.NUM_LEDS)
-            g.render(self.led_art, 2) 
-            self.led_art.show()
-        except ValueError as err:
-            pass
+        distance = max(t - self.last_t, 0.0) * self.DISTANCE_PER_FRAME * self.FPS
+        self.last_t = t
 
+        g = self.gradient
         if self.direction:
-            self.move_points(self.DISTANCE_PER_FRAME)
-            if self.palette[0][0] > 0.0:
-                self.palette.insert(0, [ self.palette[0][0] - self.get_point_distance(), self.source.pop(0)])
-            try:
-                while self.palette[-2][0] > 1.0:
-                    self.palette.pop()
-            except IndexError:
-                pass
+            g.scroll(distance)
+            while g.position(0) > 0.0:
+                g.push_front(g.position(0) - self.get_point_distance(), self.next_source_color())
+            while len(g) > 2 and g.position(-2) > 1.0:
+                g.pop_back()
         else:
-            self.move_points(-self.DISTANCE_PER_FRAME)
-            if self.palette[-1][0] < 1.0:
-                self.palette.append([self.palette[-1][0] + self.get_point_distance(), self.source.pop(0)])
-            try:
-                while self.palette[1][0] < 0.0:
-                    self.palette.pop(0)
-            except IndexError:
-                pass
+            distance = -distance
+            g.scroll(distance)
+            while g.position(-1) < 1.0:
+                g.push_back(g.position(-1) + self.get_point_distance(), self.next_source_color())
+            while len(g) > 2 and g.position(1) < 0.0:
+                g.pop_front()
+
+        return distance * (config.NUM_LEDS - 1)
 
-        if not self.source:
-            self.fill_source()
 
-        sleep(.01)
+    def render_pixels(self, start, end, pixel_shift=0.0):
+        return self.gradient.render_pixels(config.NUM_LEDS, start, end, pixel_shift)
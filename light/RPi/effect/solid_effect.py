@@ -7,6 +7,7 @@ import effect
 class SolidEffect(effect.Effect):
 
     NAME = "solid"
+    FPS = 10
 
     def __init__(self, led_art):
         effect.Effect.__init__(self, led_art, self.NAME)
@@ -21,6 +22,5 @@ class SolidEffect(effect.Effect):
     def set_color(self, color):
         self.color = color
 
-    def loop(self):
+    def render(self, t):
         self.led_art.set_color(self.color)
-        self.led_art.show()
@@ -1,9 +1,5 @@
-from neopixel import Color
-from colorsys import rgb_to_hsv
-from time import sleep
-import config
-from random import random, randint
-import palette
+from random import random
+import color as colors
 import effect
 from math import fmod
 
@@ -11,6 +7,7 @@ from math import fmod
 class SparkleEffect(effect.Effect):
 
     NAME = "sparkle"
+    FPS = 3
 
     def __init__(self, led_art):
         effect.Effect.__init__(self, led_art, self.NAME)
@@ -21,9 +18,11 @@ class SparkleEffect(effect.Effect):
     def setup(self):
         self.hue = random()
         self.pal = self.create_analogous_palette()
+        self.last_t = 0.0
+        self.dots = 0.0
 
     def set_color(self, color):
-        self.hue, _, _ = rgb_to_hsv(color[0] / 255.0, color[1] / 255.0, color[2] / 255.0)
+        self.hue, _, _ = colors.rgb_to_hsv(color)
         self.pal = self.create_analogous_palette()
 
     def nudge(self):
@@ -32,25 +31,24 @@ class SparkleEffect(effect.Effect):
 
     def create_analogous_palette(self):
         jitter = .005 + (random() / 64) 
-        return (palette.make_hsv(self.hue),
-                palette.make_hsv(fmod(self.hue - jitter + 1.0, 1.0)),
-                palette.make_hsv(fmod(self.hue - (jitter * 2) + 1.0, 1.0)),
-                palette.make_hsv(fmod(self.hue + jitter, 1.0)),
-                palette.make_hsv(fmod(self.hue + (jitter * 2), 1.0)))
-
-    def loop(self):
-
-        for strip in self.led_art.strips:
-            for i in range(config.NUM_LEDS):
-                color = strip.getPixelColor(i)
-                color = [color >> 16, (color >> 8) & 0xFF, color & 0xFF]
-                for j in range(3):
-                    color[j] = int(float(color[j]) * self.FADE_CONSTANT)
-                strip.setPixelColor(i, Color(color[0], color[1], color[2]))
-
-            for dot in range(self.DOTS):
-                strip.setPixelColor(randint(0, config.NUM_LEDS-1), Color(*self.pal[randint(0, len(self.pal)-1)]))
-
-        self.led_art.show()
-        sleep(.3)
+        # Packed colors, ready to drop into the frame
+        return [ colors.hsv_to_packed(self.hue),
+                 colors.hsv_to_packed(self.hue - jitter),
+                 colors.hsv_to_packed(self.hue - (jitter * 2)),
+                 colors.hsv_to_packed(self.hue + jitter),
+                 colors.hsv_to_packed(self.hue + (jitter * 2)) ]
+
+    def render(self, t):
+
+        frames = max(t - self.last_t, 0.0) * self.FPS
+        self.last_t = t
+        fade = self.FADE_CONSTANT ** frames
+        self.dots += self.DOTS * frames
+        dots = int(self.dots)
+        self.dots -= dots
+
+        for frame in self.led_art.draw_frames:
+            frame.decay(fade)
+            frame.add_dots(dots, self.pal)
+
         self.hue += fmod(self.hue + .01, 1.0)
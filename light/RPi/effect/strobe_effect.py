@@ -1,13 +1,14 @@
 from random import random
 from math import sin, pi
-from time import sleep, time
 
 import effect
-import palette
+import color as colors
 
 
 class StrobeEffect(effect.Effect):
 
+    FPS = 100
+
     def __init__(self, led_art, name, period, hue_increment):
         effect.Effect.__init__(self, led_art, name)
         self.period = period
@@ -20,27 +21,24 @@ class StrobeEffect(effect.Effect):
 
 
     def setup(self):
-        self.next_update = time()
+        self.flash = -1
 
 
     def set_color(self, color):
         pass
 
 
-    def loop(self):
+    def render(self, t):
 
-        if time() > self.next_update:
-            self.next_update += self.update_interval
+        flash = int(t / self.update_interval)
+        if flash != self.flash:
+            self.flash = flash
+            self.state = flash % 2
+            self.hue = flash * self.hue_increment
 
             if self.state:
-                color = (0,0,0)
+                self.color = (0,0,0)
             else:
-                color = palette.make_hsv(self.hue, 1.0, .5 + (random()/2.0))
-
-            self.state = not self.state
-            self.led_art.set_color(color)
-            self.led_art.show()
-
-            self.hue += self.hue_increment
+                self.color = colors.hsv_to_rgb(self.hue, 1.0, .5 + (random()/2.0))
 
-        sleep(.01)
+        self.led_art.set_color(self.color)
@@ -1,6 +1,5 @@
 from random import random, randint, seed, uniform
 from math import fmod, sin, pi, cos
-from time import sleep, time
 from colorsys import hsv_to_rgb, rgb_to_hsv, rgb_to_hsv
 
 import config
@@ -12,8 +11,13 @@ import effect
 class TestEffect(effect.Effect):
 
     NAME = "test"
+    FPS = 60
+    SCROLLING = True
     POINTS = 16
 
+    # radians per second that drive the scale/offset wobble
+    SPEED = 4.8
+
     def __init__(self, led_art):
         effect.Effect.__init__(self, led_art, self.NAME)
 
@@ -30,6 +34,7 @@ class TestEffect(effect.Effect):
             self.palette.append( [ point_distance * i , self.source[ i % len(self.source) ] ] )
 
         self.palette.append( [ point_distance * self.POINTS , self.palette[0][1] ] )
+        self.gradient = gradient.Gradient(self.palette, config.NUM_LEDS)
 
 
     def set_color(self, color):
@@ -41,21 +46,19 @@ class TestEffect(effect.Effect):
         print()
 
 
-    def loop(self):
-
-        try:
-            g = gradient.Gradient(self.palette, config.NUM_LEDS)
-            g.set_scale(self.scale)
-            g.set_offset(self.offset)
-            g.render(self.led_art, 2) 
-            self.led_art.show()
-        except ValueError as err:
-            print(err) 
-            pass
+    def scroll(self, t):
 
-        self.t += .08
+        # The gradient only moves along by offset / scale, so the wobble is a pure scroll
+        last = self.offset / self.scale
+        self.t = t * self.SPEED
         self.scale = 2.0 + (sin(self.t) / 1.0)
         self.offset = .5 + (cos(self.t) / 4.0)
 #        print("%.3f %.3f" % (self.offset, self.scale)) 
 
-        sleep(.005)
+        self.gradient.set_scale(self.scale)
+        self.gradient.set_offset(self.offset)
+        return (last - self.offset / self.scale) * (config.NUM_LEDS - 1)
+
+
+    def render_pixels(self, start, end, pixel_shift=0.0):
+        return self.gradient.render_pixels(start, end, pixel_shift)
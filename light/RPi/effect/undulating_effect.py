@@ -11,6 +11,7 @@ from lips import CHANNEL_0, CHANNEL_1, CHANNEL_BOTH
 class UndulatingEffect(effect.Effect):
 
     NAME = "undulating"
+    PERIODIC_FRAMES = 40
 
     def __init__(self, led_art):
         effect.Effect.__init__(self, led_art, self.NAME)
@@ -20,7 +21,7 @@ class UndulatingEffect(effect.Effect):
     def setup(self):
         self.color_index = 0
         self.uoap_index = 0
-        self.uaop_steps = 40
+        self.uaop_steps = self.PERIODIC_FRAMES
         self.uoap_increment = 1.0 / self.uaop_steps 
 
 
@@ -32,19 +33,12 @@ class UndulatingEffect(effect.Effect):
         self.color_index = (self.color_index + 1) % 2
 
 
-    def loop(self):
-        t = self.uoap_index * 2 * pi
-        jitter = sin(t) / 4
+    def render(self, t):
+        self.uoap_index = self.frame_index(t) * self.uoap_increment
+        jitter = sin(self.uoap_index * 2 * pi) / 4
         p = [ (0.0, self.colors[0]), 
               (0.45 + jitter, self.colors[1]),
               (0.65 + jitter, self.colors[1]),
               (1.0, self.colors[0])
         ]
-        g = gradient.Gradient(p, config.NUM_LEDS)
-        g.render(self.led_art, CHANNEL_BOTH)
-
-        self.led_art.show()
-
-        self.uoap_index += self.uoap_increment
-        if self.uoap_index > 1.0:
-            self.uoap_index = 0.0
+        self.led_art.set_frame(gradient.lut_cache.get(p, config.NUM_LEDS), CHANNEL_BOTH)
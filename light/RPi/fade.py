@@ -0,0 +1,82 @@
+from threading import Lock
+from time import monotonic
+
+
+def linear(x):
+    return x
+
+
+def ease_in(x):
+    return x * x
+
+
+def ease_out(x):
+    return x * (2.0 - x)
+
+
+def ease_in_out(x):
+    return x * x * (3.0 - 2.0 * x)
+
+
+EASINGS = {
+    "linear" : linear,
+    "ease-in" : ease_in,
+    "ease-out" : ease_out,
+    "ease-in-out" : ease_in_out
+}
+
+
+class Fade(object):
+    '''
+        A time based fade of a single value. The render loop asks for value() once per frame,
+        start() can be called at any time and picks up from wherever the value is right now,
+        so retargeting an in-flight fade doesn't jump.
+    '''
+
+    def __init__(self, value=0.0, easing=ease_in_out):
+        self.lock = Lock()
+        self.easing = easing
+        self.start_value = value
+        self.target = value
+        self.start_time = 0.0
+        self.duration = 0.0
+
+
+    def start(self, target, duration, easing=None, now=None):
+        if now is None:
+            now = monotonic()
+
+        with self.lock:
+            self.start_value = self._value(now)
+            self.target = target
+            self.start_time = now
+            self.duration = duration
+            if easing:
+                self.easing = easing
+
+
+    def value(self, now=None):
+        if now is None:
+            now = monotonic()
+
+        with self.lock:
+            return self._value(now)
+
+
+    def running(self, now=None):
+        if now is None:
+            now = monotonic()
+
+        with self.lock:
+            return self.duration > 0.0 and now - self.start_time < self.duration
+
+
+    def _value(self, now):
+        if self.duration <= 0.0:
+            return self.target
+
+        x = (now - self.start_time) / self.duration
+        if x >= 1.0:
+            return self.target
+
+        return self.start_value + (self.target - self.start_value) * self.easing(x)
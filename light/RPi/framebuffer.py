@@ -0,0 +1,219 @@
+import ctypes
+from array import array
+from random import randint
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def pack(col):
+    ''' Pack an (r, g, b) tuple into a 0xRRGGBB word, the same value neopixel.Color() returns. '''
+    return (col[0] << 16) | (col[1] << 8) | col[2]
+
+
+def unpack(word):
+    return ((word >> 16) & 0xFF, (word >> 8) & 0xFF, word & 0xFF)
+
+
+class FrameBuffer(object):
+    '''
+        A contiguous buffer of packed 0xRRGGBB words, one per LED. Effects write into this
+        and push() copies the whole thing into the strip's LED array in one go.
+    '''
+
+    def __init__(self, num_leds):
+        self.num_leds = num_leds
+        if np is not None:
+            self.pixels = np.zeros(num_leds, dtype=np.uint32)
+        else:
+            self.pixels = array('I', bytes(4 * num_leds))
+
+
+    def fill(self, word):
+        if np is not None:
+            self.pixels.fill(word)
+        else:
+            self.pixels[:] = array('I', [word]) * self.num_leds
+
+
+    def set_frame(self, frame):
+        self.pixels[:] = frame
+
+
+    def set_pixels(self, start, pixels):
+        self.pixels[start:start + len(pixels)] = pixels
+
+
+    def shift(self, count):
+        ''' Move the frame count LEDs towards the end of the strip, or towards the start if count is
+            negative. The LEDs that are uncovered keep their old values until they're drawn over. '''
+
+        if not count or abs(count) >= self.num_leds:
+            return
+
+        address = self.address()
+        if count > 0:
+            ctypes.memmove(address + 4 * count, address, 4 * (self.num_leds - count))
+        else:
+            ctypes.memmove(address, address - 4 * count, 4 * (self.num_leds + count))
+
+
+    def decay(self, factor):
+        ''' Scale every LED's color by factor, from 0.0 to 1.0, for trails and fades. This is a fixed point
+            multiply and shift, with red and blue done together in one multiply and green in another. '''
+
+        scale = int(min(max(factor, 0.0), 1.0) * 256.0 + .5)
+        if scale == 256:
+            return
+
+        if np is not None:
+            pixels = self.pixels
+            red_blue = pixels & 0xFF00FF
+            red_blue *= scale
+            red_blue >>= 8
+            red_blue &= 0xFF00FF
+            pixels &= 0x00FF00
+            pixels *= scale
+            pixels >>= 8
+            pixels &= 0x00FF00
+            pixels |= red_blue
+            return
+
+        self.pixels[:] = array('I', [ ((((word & 0xFF00FF) * scale) >> 8) & 0xFF00FF) | ((((word & 0x00FF00) * scale) >> 8) & 0x00FF00)
+                                      for word in self.pixels ])
+
+
+    def add_dots(self, count, words):
+        ''' Set count randomly chosen LEDs to colors randomly picked from words, a list of packed colors '''
+
+        if count <= 0:
+            return
+
+        if np is not None:
+            words = np.asarray(words, dtype=np.uint32)
+            self.pixels[np.random.randint(0, self.num_leds, count)] = words[np.random.randint(0, len(words), count)]
+            return
+
+        for dot in range(count):
+            self.pixels[randint(0, self.num_leds - 1)] = words[randint(0, len(words) - 1)]
+
+
+    def snapshot(self):
+        if np is not None:
+            return self.pixels.copy()
+        return array('I', self.pixels)
+
+
+    def address(self):
+        if np is not None:
+            return self.pixels.ctypes.data
+        return self.pixels.buffer_info()[0]
+
+
+    def push(self, strip, led_pointer=None):
+        ''' Copy the frame into the strip. If we know where the driver keeps its LED array, this is a
+            single memmove, otherwise fall back to a slice assignment on the strip's LED data. '''
+
+        if led_pointer:
+            ctypes.memmove(led_pointer, self.address(), 4 * self.num_leds)
+        else:
+            strip._led_data[0:self.num_leds] = self.pixels.tolist()
+
+
+class ChannelTransform(object):
+    '''
+        Where each LED of a strip takes its color from in a rendered frame. The frame can be
+        reversed and rotated by offset LEDs, and only LEDs start to end - 1 of the strip are lit.
+        This is worked out once into an index map, so applying it is a single gather.
+    '''
+
+    def __init__(self, num_leds, reverse=False, offset=0, start=0, end=None):
+        self.num_leds = num_leds
+        self.start = start
+        self.end = num_leds if end is None else end
+
+        index = []
+        for led in range(self.start, self.end):
+            source = (led + offset) % num_leds
+            index.append(num_leds - 1 - source if reverse else source)
+
+        if np is not None:
+            self.index = np.array(index, dtype=np.intp)
+        else:
+            self.index = index
+
+
+    def apply(self, source, dest):
+        ''' Fill dest from source. LEDs outside of start to end are never written, so they stay dark. '''
+
+        if np is not None:
+            np.take(source.pixels, self.index, out=dest.pixels[self.start:self.end])
+        else:
+            pixels = source.pixels
+            dest.pixels[self.start:self.end] = array('I', [ pixels[i] for i in self.index ])
+
+
+def make_transform(spec, num_leds):
+    ''' A ChannelTransform from a config dict with any of reverse, offset, start and end, or None '''
+
+    if not spec:
+        return None
+
+    return ChannelTransform(num_leds, **spec)
+
+
+class FrameCache(object):
+    '''
+        Snapshots of the framebuffers for each frame of a periodic effect's cycle, keyed by
+        the frame's index in the cycle. Stops taking new frames once max_bytes is used up.
+    '''
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.frames = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, index):
+        frames = self.frames.get(index)
+        if frames is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return frames
+
+
+    def put(self, index, framebuffers):
+        size = sum(4 * fb.num_leds for fb in framebuffers)
+        if self.bytes + size > self.max_bytes:
+            return False
+
+        self.frames[index] = [ fb.snapshot() for fb in framebuffers ]
+        self.bytes += size
+        return True
+
+
+    def clear(self):
+        self.frames = {}
+        self.bytes = 0
+
+
+    def stats(self):
+        return { "frames" : len(self.frames),
+                 "bytes" : self.bytes,
+                 "hits" : self.hits,
+                 "misses" : self.misses }
+
+
+def led_pointer(strip):
+    ''' Return the address of the rpi_ws281x LED array for this strip, or None if we can't get to it. '''
+
+    try:
+        from neopixel import ws
+        return int(ws.ws2811_channel_t_leds_get(strip._channel))
+    except (ImportError, AttributeError, TypeError):
+        return None
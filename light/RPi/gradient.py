@@ -1,30 +1,55 @@
-from colorsys import hsv_to_rgb
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
 from math import fabs, fmod
-import os
-from neopixel import Color
 
-class Gradient(object):
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class CompiledGradient(object):
+    '''
+        A palette that has been validated and split up once, so it can be rendered many times or
+        turned into a fixed resolution lookup table. Stop offsets, colors and the slope of each
+        color channel from one stop to the next are kept in parallel arrays, so a lookup is a
+        binary search and one multiply-add per channel. Stops can be moved or recolored in place
+        for palettes that animate.
+    '''
+
+    __slots__ = ('stops', 'colors', 'slopes', 'num_leds', 'led_scale', 'led_offset')
+
+    # Added before truncating to an int, so that a color that lands right on a stop comes out as
+    # that stop's color and not one less because of rounding in the slope
+    ROUNDING = 1e-6
 
     def __init__(self, palette, num_leds = 1):
 
         # palletes are in format [ (.345, (128, 0, 128)) ]
-        self._validate_palette(palette)
-        self.palette = palette
+        validate_palette(palette)
+        self.stops = array('d', [ float(p[0]) for p in palette ])
+        self.colors = array('d', [ float(c) for p in palette for c in p[1][:3] ])
+        self.slopes = array('d', bytes(8 * 3 * (len(palette) - 1)))
+        for segment in range(len(palette) - 1):
+            self._update_slope(segment)
+
         self.num_leds = num_leds
         self.led_scale = 1.0
         self.led_offset = 0.0
 
 
-    def _validate_palette(self, palette):
+    def __len__(self):
+        return len(self.stops)
+
 
-        if len(palette) < 2:
-            raise ValueError("Palette must have at least two points.")
+    def _update_slope(self, segment):
+        span = self.stops[segment + 1] - self.stops[segment]
+        for channel in range(segment * 3, segment * 3 + 3):
+            self.slopes[channel] = (self.colors[channel + 3] - self.colors[channel]) / span if span else 0.0
 
-        if palette[0][0] > 0.0:
-            raise ValueError("First point in palette must be less than or equal to 0.0")
 
-        if palette[-1][0] < 1.0:
-            raise ValueError("Last point in palette must be greater than or equal to 1.0")
+    def key(self):
+        return (tuple(self.stops), tuple(self.colors))
 
 
     def set_scale(self, scale):
@@ -35,37 +60,307 @@ class Gradient(object):
         self.led_offset = offset
 
 
+    def set_stop(self, index, offset = None, color = None):
+        ''' Move and/or recolor one stop, without building a new gradient. A stop can't be moved past
+            its neighbours, or the ends of the palette moved inside 0.0 - 1.0. '''
+
+        last = len(self.stops) - 1
+        if index < 0:
+            index += last + 1
+
+        if offset is not None:
+            if index > 0 and offset < self.stops[index - 1] or index < last and offset > self.stops[index + 1]:
+                raise ValueError("Stop can't be moved past its neighbours.")
+            if index == 0 and offset > 0.0 or index == last and offset < 1.0:
+                raise ValueError("End stops must cover 0.0 to 1.0")
+            self.stops[index] = float(offset)
+
+        if color is not None:
+            self.colors[index * 3:index * 3 + 3] = array('d', [ float(c) for c in color[:3] ])
+
+        if index > 0:
+            self._update_slope(index - 1)
+        if index < last:
+            self._update_slope(index)
+
+
     def get_color_by_offset(self, offset):
 
-        if offset < 0.0 or offset > 1.0:
+        stops = self.stops
+        if offset < stops[0] or offset > stops[-1]:
             raise IndexError("Invalid offset.")
 
-        for index in range(len(self.palette)):
+        index = bisect_left(stops, offset, 1, len(stops)) - 1
+        distance = offset - stops[index]
+        colors = self.colors
+        slopes = self.slopes
+        index *= 3
+        return (min(int(colors[index] + slopes[index] * distance + self.ROUNDING), 255),
+                min(int(colors[index + 1] + slopes[index + 1] * distance + self.ROUNDING), 255),
+                min(int(colors[index + 2] + slopes[index + 2] * distance + self.ROUNDING), 255))
 
-            # skip the first item
-            if index == 0:
-                continue
 
-            if self.palette[index][0] >= offset:
-                section_begin_offset = self.palette[index-1][0]
-                section_end_offset = self.palette[index][0]
+    def render(self, led_art, channel):
+        led_art.set_frame(self.render_frame(), channel)
 
-                percent = (offset - section_begin_offset) / (section_end_offset - section_begin_offset)
-                new_color = []
-                for color in range(3):
-                    new_color.append(int(self.palette[index-1][1][color] + 
-                            ((self.palette[index][1][color] - self.palette[index-1][1][color]) * percent)))
 
-                return (min(new_color[0], 255), min(new_color[1], 255), min(new_color[2], 255))
+    def render_frame(self, num_leds = None, shift = 0.0):
+        ''' Render the whole strip in one go and return a buffer of packed 0xRRGGBB words,
+            one per LED. This is a numpy uint32 array if numpy is available, otherwise an array('I'). '''
 
-        assert False
+        if num_leds is None:
+            num_leds = self.num_leds
+        return self.lookup(led_offsets(num_leds, shift + self.led_offset / self.led_scale))
 
 
-    def render(self, led_art, channel):
+    def render_pixels(self, start, end, pixel_shift = 0.0):
+        ''' Render LEDs start to end - 1 only, sampled pixel_shift LEDs further along the palette '''
+
+        return self.lookup(led_offsets(self.num_leds, self.led_offset / self.led_scale, start, end, pixel_shift))
+
+
+    def lut(self, resolution):
+        ''' A table of resolution packed colors, the same as rendering onto that many LEDs '''
+        return self.render_frame(resolution)
+
+
+    def lookup(self, offsets):
+        ''' The packed colors at each of offsets '''
+
+        if np is not None:
+            return self._lookup_numpy(offsets)
+
+        return self._lookup_python(offsets)
+
+
+    def _lookup_numpy(self, offsets):
+
+        # Views on our arrays, so they always see the latest set_stop()
+        stops = np.frombuffer(self.stops, dtype=np.float64)
+        colors = np.frombuffer(self.colors, dtype=np.float64).reshape(-1, 3)
+        slopes = np.frombuffer(self.slopes, dtype=np.float64).reshape(-1, 3)
+        offsets = np.asarray(offsets, dtype=np.float64)
+
+        if offsets.min() < stops[0] or offsets.max() > stops[-1]:
+            raise IndexError("Invalid offset.")
+
+        # the segment that ends at the first stop (after the zeroth) that is >= offset
+        begin = np.searchsorted(stops[1:-1], offsets, side='left')
+        rgb = colors[begin] + slopes[begin] * (offsets - stops[begin])[:, np.newaxis]
+        rgb += self.ROUNDING
+        rgb = rgb.astype(np.uint32)
+        np.minimum(rgb, 255, out=rgb)
+
+        return (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+
+
+    def _lookup_python(self, offsets):
+
+        stops = self.stops
+        colors = self.colors
+        slopes = self.slopes
+        first = stops[0]
+        last = stops[-1]
+        count = len(stops)
+        rounding = self.ROUNDING
+
+        frame = array('I', bytes(4 * len(offsets)))
+        for led, offset in enumerate(offsets):
+            if offset < first or offset > last:
+                raise IndexError("Invalid offset.")
+
+            index = bisect_left(stops, offset, 1, count) - 1
+            distance = offset - stops[index]
+            index *= 3
+            red = min(int(colors[index] + slopes[index] * distance + rounding), 255)
+            green = min(int(colors[index + 1] + slopes[index + 1] * distance + rounding), 255)
+            blue = min(int(colors[index + 2] + slopes[index + 2] * distance + rounding), 255)
+            frame[led] = (red << 16) | (green << 8) | blue
+
+        return frame
+
+
+class Gradient(CompiledGradient):
+    '''
+        A CompiledGradient that also keeps the palette it was made from.
+    '''
+
+    __slots__ = ('palette',)
+
+    def __init__(self, palette, num_leds = 1):
+        CompiledGradient.__init__(self, palette, num_leds)
+        self.palette = palette
+
+
+class LutCache(object):
+    '''
+        A bounded LRU cache of gradient lookup tables, keyed by palette contents and resolution.
+    '''
+
+    def __init__(self, size = 64):
+        self.size = size
+        self.luts = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def get(self, palette, resolution):
+        key = (tuple((float(p[0]), tuple(p[1])) for p in palette), resolution)
+        try:
+            lut = self.luts[key]
+            self.luts.move_to_end(key)
+            self.hits += 1
+            return lut
+        except KeyError:
+            pass
+
+        self.misses += 1
+        lut = CompiledGradient(palette).lut(resolution)
+        self.luts[key] = lut
+        if len(self.luts) > self.size:
+            self.luts.popitem(last=False)
+            self.evictions += 1
+
+        return lut
+
+
+    def clear(self):
+        self.luts.clear()
+
+
+    def stats(self):
+        return { "size" : len(self.luts),
+                 "hits" : self.hits,
+                 "misses" : self.misses,
+                 "evictions" : self.evictions }
+
+
+lut_cache = LutCache()
+
+
+class ScrollingGradient(object):
+    '''
+        Control points that scroll along the strip together. Points are kept in a deque at fixed
+        base positions and one phase is added to all of them, so scrolling is O(1) and adding or
+        dropping a point at either edge doesn't touch the others. Positions passed in and handed
+        out are the actual positions on the strip, base + phase.
+    '''
+
+    # Fold the phase back into the base positions before it gets big enough to cost us precision
+    MAX_PHASE = 1000.0
+
+    def __init__(self, points = ()):
+        self.points = deque()
+        self.phase = 0.0
+        self._compiled = None
+        self._compiled_phase = 0.0
+        for position, color in points:
+            self.push_back(position, color)
+
+
+    def __len__(self):
+        return len(self.points)
+
+
+    def scroll(self, distance):
+        self.phase += distance
+        if abs(self.phase) > self.MAX_PHASE:
+            self.points = deque((base + self.phase, color) for base, color in self.points)
+            self.phase = 0.0
+            self._compiled = None
+
+
+    def position(self, index):
+        return self.points[index][0] + self.phase
+
+
+    def push_front(self, position, color):
+        self.points.appendleft((position - self.phase, tuple(color)))
+        self._compiled = None
+
+
+    def push_back(self, position, color):
+        self.points.append((position - self.phase, tuple(color)))
+        self._compiled = None
+
+
+    def pop_front(self):
+        self._compiled = None
+        return self.points.popleft()
+
+
+    def pop_back(self):
+        self._compiled = None
+        return self.points.pop()
+
+
+    def set_color(self, index, color):
+        self.points[index] = (self.points[index][0], tuple(color))
+        if self._compiled is not None:
+            self._compiled.set_stop(index, color = color)
+
+
+    def palette(self):
+        return [ (base + self.phase, color) for base, color in self.points ]
+
+
+    def render_frame(self, num_leds):
+        return self.render_pixels(num_leds, 0, num_leds)
+
+
+    def render_pixels(self, num_leds, start, end, pixel_shift = 0.0):
+        ''' Render LEDs start to end - 1 of the strip, sampled pixel_shift LEDs further along. Unlike
+            Gradient the last LED is not wrapped back to 0.0. Raises ValueError if the points don't
+            cover the whole strip. '''
+
+        if len(self.points) < 2 or self.position(0) > 0.0 or self.position(-1) < 1.0:
+            validate_palette(self.palette())
+
+        # The stops only change when points come and go, scrolling moves the LEDs instead
+        if self._compiled is None:
+            self._compiled = CompiledGradient(self.palette())
+            self._compiled_phase = self.phase
+
+        # Clamp so that rounding in the phase can't push the end LEDs off the palette
+        stops = self._compiled.stops
+        shift = self.phase - self._compiled_phase
+        offsets = led_offsets(num_leds, 0.0, start, end, pixel_shift, wrap = False)
+        if np is not None:
+            offsets = np.clip(offsets - shift, stops[0], stops[-1])
+        else:
+            offsets = [ min(max(offset - shift, stops[0]), stops[-1]) for offset in offsets ]
+
+        return self._compiled.lookup(offsets)
+
+
+def validate_palette(palette):
+
+    if len(palette) < 2:
+        raise ValueError("Palette must have at least two points.")
+
+    if palette[0][0] > 0.0:
+        raise ValueError("First point in palette must be less than or equal to 0.0")
+
+    if palette[-1][0] < 1.0:
+        raise ValueError("Last point in palette must be greater than or equal to 1.0")
+
+
+def led_offsets(num_leds, shift = 0.0, start = 0, end = None, pixel_shift = 0.0, wrap = True):
+    ''' The palette offset of LEDs start to end - 1, moved along by shift in palette units and
+        pixel_shift in LEDs, and wrapped into 0.0 - 1.0 if wrap is set '''
+
+    if end is None:
+        end = num_leds
 
-        for led in range(self.num_leds):
-            offset = (float(led) / float(self.num_leds - 1))
-            offset = fmod(offset + self.led_offset / self.led_scale, 1.0)
+    if num_leds == 1:
+        offsets = [ shift ] * (end - start)
+    elif np is not None:
+        offsets = (np.arange(start, end) + pixel_shift) / float(num_leds - 1) + shift
+        return np.fmod(offsets, 1.0) if wrap else offsets
+    else:
+        offsets = [ ((float(led) + pixel_shift) / float(num_leds - 1)) + shift for led in range(start, end) ]
 
-            color = self.get_color_by_offset(offset)
-            led_art.set_led_color(led, color, channel)
+    if wrap:
+        return [ fmod(offset, 1.0) for offset in offsets ]
+    return offsets
@@ -1,19 +1,35 @@
 import abc
+import importlib
 import sys
 import socket
 import json
 import math
 import traceback
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from random import random, randint, seed
 from math import fmod, sin, pi
-from time import sleep, time
-from neopixel import *
+from time import sleep, time, monotonic, perf_counter
 import paho.mqtt.client as mqtt
 from colorsys import hsv_to_rgb, rgb_to_hsv, rgb_to_hsv
 
 
 import net_config
 import config
+from framebuffer import FrameBuffer, pack, led_pointer, make_transform
+from scheduler import FrameScheduler, IDLE_TIMEOUT
+from fade import Fade, EASINGS
+import commands
+from commands import CommandQueue
+from publisher import StatePublisher
+from router import TopicRouter
+from strip import make_strips
+from metrics import Metrics
+from renderer import EffectRenderer
+from channel import ChannelEffect
+from output import OutputStage
+from compositor import Compositor, Layer
+from transition import Transition
 
 
 
@@ -26,132 +42,348 @@ BRIGHTNESS_STATE_TOPIC = "%s/brightness_state" % config.NODE_ID
 COLOR_TOPIC = "%s/color" % config.NODE_ID
 COLOR_STATE_TOPIC = "%s/color_state" % config.NODE_ID
 EFFECT_TOPIC = "%s/effect" % config.NODE_ID
+EFFECT_STATE_TOPIC = "%s/effect_state" % config.NODE_ID
+CHANNEL_EFFECT_TOPIC = EFFECT_TOPIC + "/%d"
+CHANNEL_EFFECT_STATE_TOPIC = EFFECT_STATE_TOPIC + "/%d"
+METRICS_TOPIC = "%s/metrics" % config.NODE_ID
+METRICS_ENABLE_TOPIC = "%s/metrics/enable" % config.NODE_ID
+LAYERS_TOPIC = "%s/layers" % config.NODE_ID
+LAYERS_STATE_TOPIC = "%s/layers_state" % config.NODE_ID
 
-# Philips dimmer that is connected via zigbee2mqtt
-DIMMERS = [ 
+CHANNEL_0     = 0
+CHANNEL_1     = 1
+CHANNEL_BOTH  = 2
+INITIAL_BRIGHTNESS = 30
+
+# Fade times in seconds, these can be overridden in config
+FADE_ON_TIME = getattr(config, "FADE_ON_TIME", .6)
+FADE_OFF_TIME = getattr(config, "FADE_OFF_TIME", .4)
+BRIGHTNESS_STEP_TIME = getattr(config, "BRIGHTNESS_STEP_TIME", .2)
+FADE_EASING = EASINGS[getattr(config, "FADE_EASING", "ease-in-out")]
+
+# Seconds to crossfade from one effect to the next while the lights are on. At 0 effect
+# switches fade out to dark and back in instead.
+TRANSITION_TIME = getattr(config, "TRANSITION_TIME", 1.0)
+
+# Frames per second to at least run at while a brightness fade or a crossfade is going on, and
+# the longest a brightness or color command waits to be applied. Effects that run slower than
+# this are not rendered any faster, their last frame is shown again at the new brightness.
+FADE_FPS = getattr(config, "FADE_FPS", 30)
+
+# Memory we're willing to spend on replaying periodic effects
+FRAME_CACHE_BYTES = getattr(config, "FRAME_CACHE_BYTES", 1024 * 1024)
+
+# Scrolling effects only render the LEDs that scrolled into view, but get fully redrawn this often
+# to get rid of any error that crept in
+FULL_REDRAW_FRAMES = getattr(config, "FULL_REDRAW_FRAMES", 60)
+
+# "neopixel" drives the real strips, both from one rpi_ws281x render so they update together,
+# "neopixel-serial" sends to one strip after the other and "null" and "recording" (see strip.py)
+# run without any hardware
+STRIP_BACKEND = getattr(config, "STRIP_BACKEND", "neopixel")
+
+# Frame timing histograms, published to METRICS_TOPIC every METRICS_INTERVAL seconds while enabled.
+# Can be switched on and off by sending on/off to METRICS_ENABLE_TOPIC.
+METRICS_ENABLED = getattr(config, "METRICS_ENABLED", False)
+METRICS_INTERVAL = getattr(config, "METRICS_INTERVAL", 10.0)
+SHOW_METRICS = ("show_0", "show_1")
+
+# Set to a file name to log the command to photon latency of every command, one JSON object per line
+LATENCY_TRACE_LOG = getattr(config, "LATENCY_TRACE_LOG", None)
+
+# Render one frame and send it to both strips, rather than drawing each channel separately.
+# Either way the channels can be remapped by CHANNEL_TRANSFORMS, one dict (reverse, offset,
+# start, end; see framebuffer.ChannelTransform) or None per channel.
+MIRROR_CHANNELS = getattr(config, "MIRROR_CHANNELS", True)
+CHANNEL_TRANSFORMS = getattr(config, "CHANNEL_TRANSFORMS", (None, None))
+
+# Threads that render the effects running on a single channel, alongside the shared effect
+RENDER_WORKERS = getattr(config, "RENDER_WORKERS", 2)
+
+# Effects drawn on top of whatever the channels show, bottom to top. Each is a dict with the
+# "effect" name and optionally its "color", a "blend" mode (max by default, add, multiply, alpha
+# or mix; see compositor.blend), an "opacity" from 0.0 to 1.0 and an "fps" to render it at, 0 for a
+# layer that doesn't change. Can be replaced with a JSON list of the same on LAYERS_TOPIC.
+LAYERS = getattr(config, "LAYERS", [])
+
+# Corrections applied to every frame on its way out, along with the brightness: gamma correction
+# and how much of red, green and blue to use to even out the strips' color balance
+OUTPUT_GAMMA = getattr(config, "OUTPUT_GAMMA", False)
+COLOR_BALANCE = getattr(config, "COLOR_BALANCE", (1.0, 1.0, 1.0))
+
+# Max number of state updates per second we send to the broker
+STATE_PUBLISH_RATE = getattr(config, "STATE_PUBLISH_RATE", 2.0)
+
+# payload on COMMAND_TOPIC -> action
+COMMAND_ACTIONS = {
+    "mode" : "next_effect",
+    "on" : "turn_on",
+    "off" : "turn_off",
+    "toggle" : "toggle"
+}
+
+# What the buttons on a Philips Hue dimmer do, unless a dimmer overrides them. Actions are
+# described in commands.make_action()
+HUE_DIMMER_ACTIONS = {
+    "on-press" : "turn_on",
+    "off-press" : "turn_off",
+    "off-hold" : "nudge",
+    "up-press" : "brightness_up",
+    "down-press" : "brightness_down",
+    "up-hold" : "next_effect",
+    "down-hold" : "previous_effect"
+}
+
+# Philips dimmers that are connected via zigbee2mqtt. Set DIMMERS in config to map your own;
+# the topic can use MQTT wildcards and a dimmer without "actions" gets HUE_DIMMER_ACTIONS.
+DIMMERS = getattr(config, "DIMMERS", [ 
     { 
       "topic" : "zigbee2mqtt/0x00178801080a1a7b/action",
-      "name" : "bed"
+      "name" : "bed",
+      "actions" : dict(HUE_DIMMER_ACTIONS, **{
+          "on-hold" : { "brightness" : 100, "duration" : FADE_ON_TIME }
+      })
     },
     { 
       "topic" : "zigbee2mqtt/0x0017880108f2bc2c/action",
-      "name" : "wall"
+      "name" : "wall",
+      "actions" : dict(HUE_DIMMER_ACTIONS, **{
+          "on-press" : { "effect" : "solid", "brightness" : 100, "color" : (255, 180, 59) },
+          "on-hold" : { "effect" : "bedtime", "brightness" : 50 },
+          "off-hold" : { "effect" : "bedtime", "brightness" : 5 }
+      })
     }
+])
+
+# Effects that add_effects() registers, in order: module in effect/, class and extra arguments
+EFFECTS = [
+    ("color_amble_effect", "ColorAmbleEffect", ()),
+    ("solid_effect", "SolidEffect", ()),
+    ("chill_bed_time_effect", "ChillBedTimeEffect", ()),
+    ("sparkle_effect", "SparkleEffect", ()),
+    ("dynamic_colorcycle_effect", "DynamicColorCycleEffect", ()),
+    ("undulating_effect", "UndulatingEffect", ()),
+    ("bootie_call_effect", "BootieCallEffect", (.0005,)),
+    ("test_effect", "TestEffect", ())
 ]
 
-CHANNEL_0     = 0
-CHANNEL_1     = 1
-CHANNEL_BOTH  = 2
-INITIAL_BRIGHTNESS = 30
-
-from effect import color_amble_effect
-from effect import solid_effect
-from effect import sparkle_effect
-from effect import undulating_effect
-from effect import colorcycle_effect
-from effect import bootie_call_effect
-from effect import strobe_effect
-from effect import test_effect
-from effect import chill_bed_time_effect
-from effect import dynamic_colorcycle_effect
-
 class Lips(object):
 
 
-    def __init__(self):
+    def __init__(self, backend=STRIP_BACKEND):
         self.brightness = 0
+        self.output_brightness = 0
+        self.fade = Fade(0, FADE_EASING)
+        self.pending_effect = None
         self.last_brightness = INITIAL_BRIGHTNESS
         self.effect_list = []
         self.current_effect = None
         self.current_effect_index = -1
+        self.effect_start = monotonic()
+        self.effect_next_frame = self.effect_start
 
-        self.strips = [ Adafruit_NeoPixel(config.NUM_LEDS, config.CH0_LED_PIN, 800000, 10, False, 255, 0),
-                        Adafruit_NeoPixel(config.NUM_LEDS, config.CH1_LED_PIN, 800000, 10, False, 255, 1) ]
+        self.strips = make_strips(backend, config.NUM_LEDS, (config.CH0_LED_PIN, config.CH1_LED_PIN))
         for s in self.strips:
             s.begin()
+            s.setBrightness(255)
+
+        # Effects draw into draw_frames: both frames, or just the first one if the channels are mirrored
+        self.mirrored = MIRROR_CHANNELS
+        self.frames = [ FrameBuffer(config.NUM_LEDS), FrameBuffer(config.NUM_LEDS) ]
+        self.draw_frames = self.frames[:1] if self.mirrored else self.frames
+        self.transforms = [ make_transform(spec, config.NUM_LEDS) for spec in CHANNEL_TRANSFORMS ]
+        self.transformed = [ FrameBuffer(config.NUM_LEDS) if t else None for t in self.transforms ]
+
+        # Brightness is applied by the output stage, the strips themselves are left at full brightness
+        self.output = OutputStage(OUTPUT_GAMMA, COLOR_BALANCE)
+        self.outputs = [ FrameBuffer(config.NUM_LEDS), FrameBuffer(config.NUM_LEDS) ]
+        self.led_pointers = [ led_pointer(s) for s in self.strips ]
+
+        # Strips on the same driver are both sent by one show()
+        driver = getattr(self.strips[0], "driver", None)
+        self.shared_driver = driver is not None and getattr(self.strips[1], "driver", None) is driver
+        self.renderer = EffectRenderer(self, config.NUM_LEDS, FRAME_CACHE_BYTES, FULL_REDRAW_FRAMES)
+
+        # A ChannelEffect per channel that shows something other than current_effect, or None.
+        # Both channels can share one ChannelEffect.
+        self.channel_effects = [ None, None ]
+        self.render_pool = ThreadPoolExecutor(RENDER_WORKERS)
+        self.compositor = Compositor(config.NUM_LEDS)
+        self.transition = None
+
+        self.scheduler = FrameScheduler(coalesce_fps=FADE_FPS)
+        self.commands = CommandQueue(wake=self.scheduler.wake, wake_idle=self.scheduler.wake_idle)
+        self.commands.trace_to(LATENCY_TRACE_LOG)
 
         self.mqttc = None
+        self.state = StatePublisher(self.publish, STATE_PUBLISH_RATE)
+        self.metrics = Metrics(("render",) + SHOW_METRICS + ("sleep", "mqtt"), METRICS_INTERVAL)
+        self.metrics.enable(METRICS_ENABLED)
+        self.setup_routes()
 
 
-    def publish(self, topic, payload):
+    def publish(self, topic, payload, retain=False):
         if not self.mqttc:
             return
 
-        self.mqttc.publish(topic, payload)
+        self.mqttc.publish(topic, payload, retain=retain)
+
+
+    def channel_frames(self, channel):
+        ''' The framebuffers to draw into for channel. Mirrored channels share one. '''
+
+        if self.mirrored or channel == CHANNEL_0:
+            return self.draw_frames[:1]
+        if channel == CHANNEL_1:
+            return self.frames[1:]
+        return self.frames
 
 
     def set_color(self, col, channel=CHANNEL_BOTH):
-        for i in range(config.NUM_LEDS):
-            if channel == CHANNEL_0 or channel == CHANNEL_BOTH:
-                self.strips[0].setPixelColor(i, Color(col[1], col[0], col[2]))
-            if channel == CHANNEL_1 or channel == CHANNEL_BOTH:
-                self.strips[1].setPixelColor(i, Color(col[1], col[0], col[2]))
+        word = pack(col)
+        for fb in self.channel_frames(channel):
+            fb.fill(word)
 
 
     def set_led_color(self, led, col, channel=CHANNEL_BOTH):
-        if channel == CHANNEL_0 or channel == CHANNEL_BOTH:
-            self.strips[0].setPixelColor(led, Color(col[1], col[0], col[2]))
-        if channel == CHANNEL_1 or channel == CHANNEL_BOTH:
-            self.strips[1].setPixelColor(led, Color(col[1], col[0], col[2]))
+        word = pack(col)
+        for fb in self.channel_frames(channel):
+            fb.pixels[led] = word
+
+
+    def set_frame(self, frame, channel=CHANNEL_BOTH):
+        for fb in self.channel_frames(channel):
+            fb.set_frame(frame)
 
 
     def show(self, channel=CHANNEL_BOTH):
-        if channel == CHANNEL_0 or channel == CHANNEL_BOTH:
+        if channel == CHANNEL_BOTH and self.shared_driver:
+            self.show_both()
+        else:
+            if channel == CHANNEL_0 or channel == CHANNEL_BOTH:
+                self.show_strip(0)
+            if channel == CHANNEL_1 or channel == CHANNEL_BOTH:
+                self.show_strip(1)
+
+        # The commands applied since the last show are on the strips now
+        self.commands.frame_shown()
+
+
+    def output_frame(self, index):
+        ''' The framebuffer strip index shows, with the layers on top and after its transform if it has one '''
+
+        if self.channel_effects[index]:
+            source = self.channel_effects[index].frame
+        else:
+            source = self.frames[0] if self.mirrored else self.frames[index]
+
+        if self.transition:
+            source = self.transition.apply(source, index)
+        source = self.compositor.compose(source, index)
+        if not self.transforms[index]:
+            return source
+
+        self.transforms[index].apply(source, self.transformed[index])
+        return self.transformed[index]
+
+
+    def push_strip(self, index):
+        self.output.apply(self.output_frame(index), self.outputs[index]).push(self.strips[index], self.led_pointers[index])
+
+
+    def show_strip(self, index):
+        if not self.metrics.enabled:
+            self.push_strip(index)
+            self.strips[index].show()
+            return
+
+        start = perf_counter()
+        self.push_strip(index)
+        self.strips[index].show()
+        self.metrics.add(SHOW_METRICS[index], perf_counter() - start)
+
+
+    def show_both(self):
+        ''' Push both frames and send them with a single render, for strips that share a driver '''
+
+        if not self.metrics.enabled:
+            self.push_strip(0)
+            self.push_strip(1)
             self.strips[0].show()
-        if channel == CHANNEL_1 or channel == CHANNEL_BOTH:
-            self.strips[1].show()
+            return
+
+        start = perf_counter()
+        self.push_strip(0)
+        pushed_0 = perf_counter()
+        self.push_strip(1)
+        pushed_1 = perf_counter()
+        self.strips[0].show()
+
+        # The render sends both strips, so it counts towards each of them
+        rendered = perf_counter() - pushed_1
+        self.metrics.add(SHOW_METRICS[0], pushed_0 - start + rendered)
+        self.metrics.add(SHOW_METRICS[1], pushed_1 - pushed_0 + rendered)
 
 
     def clear(self, channel=CHANNEL_BOTH):
         self.set_color((0,0,0), channel)
+        self.renderer.scroll_dirty = True
+        for index, channel_effect in enumerate(self.channel_effects):
+            if channel_effect and channel in (index, CHANNEL_BOTH):
+                channel_effect.clear()
+        if channel == CHANNEL_BOTH:
+            for layer in self.compositor.layers:
+                layer.channel_effect.clear()
         self.show(channel)
 
     
-    def turn_on(self):
+    def turn_on(self, duration=FADE_ON_TIME):
         if self.brightness == 0:
-            while True:
-                if self.brightness + 10 > self.last_brightness:
-                    break
-                self.set_brightness(self.brightness + 10)
-
-            self.set_brightness(self.last_brightness)
+            self.set_brightness(self.last_brightness, duration)
             print("turn on. brightness: %d" % self.brightness)
 
 
-    def turn_off(self):
+    def turn_off(self, duration=FADE_OFF_TIME):
         if self.brightness:
             self.last_brightness = self.brightness
-            while self.brightness > 0:
-                self.set_brightness(self.brightness - 5)
-
-            self.set_brightness(0)
+            self.set_brightness(0, duration)
             print("turn off.")
 
 
-    def set_brightness(self, brightness):
+    def set_brightness(self, brightness, duration=0.0):
+        ''' Set the target brightness and return right away. The render loop fades towards it. '''
 
         if brightness < 0:
             brightness = 0
         elif brightness > 100:
             brightness = 100
 
-        if self.brightness and brightness == 0:
-            if self.current_effect:
-                self.current_effect.reset()
-            self.publish(STATE_TOPIC, "0")
+        self.brightness = brightness
+        self.fade.start(brightness, duration)
 
-        if self.brightness == 0 and brightness:
-            self.publish(STATE_TOPIC, "1")
+        self.state.set(STATE_TOPIC, "1" if brightness else "0")
+        self.state.set(BRIGHTNESS_STATE_TOPIC, "%d" % brightness)
 
-        self.brightness = brightness
-        if brightness:
-            for strip in self.strips:
-                strip.setBrightness(brightness)
-                strip.show()
-        else:
-            self.clear()
 
-        self.publish(BRIGHTNESS_STATE_TOPIC, "%d" % brightness)
+    def apply_brightness(self, level):
+        ''' Called from the render loop with this frame's point on the fade '''
+
+        level = int(round(level))
+        if level == self.output_brightness:
+            return
+
+        self.output_brightness = level
+        self.output.set_level(level)
+
+        if not level:
+            if self.transition:
+                self.transition = None
+                self.update_fps()
+            if self.current_effect:
+                self.current_effect.reset()
+            for channel_effect in self.unique_channel_effects() + self.layer_effects():
+                channel_effect.effect.reset()
+            self.clear()
 
 
     def brightness_up(self):
@@ -159,9 +391,9 @@ class Lips(object):
             return
 
         if not self.brightness:
-            self.set_brightness(10)
+            self.set_brightness(10, BRIGHTNESS_STEP_TIME)
         else:
-            self.set_brightness(self.brightness + 10)
+            self.set_brightness(self.brightness + 10, BRIGHTNESS_STEP_TIME)
 
         print("UP new brightness: %d" % self.brightness)
 
@@ -172,55 +404,236 @@ class Lips(object):
 
         if self.brightness <= 10:
             self.last_brightness = 10
-            self.set_brightness(0)
-            self.clear()
+            self.set_brightness(0, BRIGHTNESS_STEP_TIME)
         else:
-            self.set_brightness(self.brightness - 10)
+            self.set_brightness(self.brightness - 10, BRIGHTNESS_STEP_TIME)
 
         print("DOWN new brightness: %d" % self.brightness)
 
 
-    def fade_in(self, target_brightness, channel=CHANNEL_BOTH):
+    def fade_in(self, target_brightness, channel=CHANNEL_BOTH, duration=FADE_ON_TIME):
         ''' this assumes that brightness has been set to zero and that a patterns is loaded ready to go '''
 
-        brightness_inc = 10
-        while self.brightness + brightness_inc < target_brightness:
-            self.set_brightness(self.brightness + brightness_inc)
+        self.set_brightness(target_brightness, duration)
+
 
-        self.set_brightness(target_brightness)
+    def switch_effect(self, index, brightness=None, color=None):
+        ''' Crossfade to the effect if the lights are on, otherwise fade out, switch to the effect and
+            fade back in, to the last brightness unless given one. That switch happens in the render
+            loop once the fade out is done. '''
 
+        if TRANSITION_TIME and self.output_brightness and self.brightness and self.current_effect:
+            self.start_transition()
+            self.pending_effect = None
+            self.activate_effect(index)
+            if color:
+                self.current_effect.set_color(color)
+            if brightness is not None:
+                self.set_brightness(brightness, TRANSITION_TIME)
+            return
 
-    def set_effect(self, effect_name):
+        if self.brightness:
+            self.last_brightness = self.brightness
+
+        self.pending_effect = (index, brightness, color)
+        self.set_brightness(0, FADE_OFF_TIME if self.output_brightness else 0.0)
+
+
+    def _switch_pending_effect(self):
+        index, brightness, color = self.pending_effect
+        self.pending_effect = None
+        self.activate_effect(index)
+        if color:
+            self.current_effect.set_color(color)
+        if not self.brightness:
+            self.set_brightness(brightness if brightness is not None else self.last_brightness, FADE_ON_TIME)
+
+
+    def start_transition(self):
+        ''' Keep what the channels show running as the outgoing side of a crossfade. If we're in the
+            middle of one already, whichever side is showing more stays, so there is only ever one
+            crossfade going on. '''
+
+        if self.transition and self.transition.amount < .5:
+            outgoing = self.transition.outgoing
+        else:
+            outgoing = list(self.channel_effects)
+            if not all(outgoing):
+                shared = ChannelEffect(self.current_effect, self.current_effect_index, config.NUM_LEDS,
+                                       FRAME_CACHE_BYTES, FULL_REDRAW_FRAMES, start=self.effect_start)
+                shared.frame.set_frame(self.frames[0].pixels)
+                outgoing = [ channel_effect or shared for channel_effect in outgoing ]
+
+        self.transition = Transition(outgoing, TRANSITION_TIME, config.NUM_LEDS, FADE_EASING)
+
+
+    def set_effect(self, effect_name, brightness=None, color=None):
         print("effect: %s" % effect_name)
         for i, effect in enumerate(self.effect_list):
             if effect.name == effect_name:
-                self.turn_off()
-                self.current_effect = effect 
-                self.current_effect.setup()
-                self.current_effect_index = i
-                self.turn_on()
+                self.switch_effect(i, brightness, color)
+                break
+        else:
+            print("Unknown effect %s" % effect_name)
+
+
+    def set_effect_color(self, color, payload):
+        if self.current_effect:
+            self.current_effect.set_color(color)
+            self.renderer.invalidate()
+        for channel_effect in self.unique_channel_effects():
+            channel_effect.set_effect_color(color)
+        self.state.set(COLOR_STATE_TOPIC, payload)
+
+
+    def activate_effect(self, index):
+        ''' Switch both channels over to the effect '''
+
+        self.current_effect = self.effect_list[index]
+        self.current_effect.setup()
+        self.current_effect_index = index
+        self.effect_start = monotonic()
+        self.effect_next_frame = self.effect_start
+        self.renderer.invalidate()
+        self.channel_effects = [ None, None ]
+        self.update_fps()
+        self.state.set(EFFECT_STATE_TOPIC, self.current_effect.name)
+        for channel in (CHANNEL_0, CHANNEL_1):
+            self.state.set(CHANNEL_EFFECT_STATE_TOPIC % channel, self.current_effect.name)
+
+
+    def set_channel_effect(self, channel, effect_name, color=None):
+        ''' Run an effect on one channel only, right away. If the other channel already shows that
+            effect and we're not asked for a different color, the two share its frames. '''
+
+        if channel == CHANNEL_BOTH:
+            self.set_effect(effect_name, color=color)
+            return
+
+        print("effect %d: %s" % (channel, effect_name))
+        for index, effect in enumerate(self.effect_list):
+            if effect.name == effect_name:
                 break
         else:
             print("Unknown effect %s" % effect_name)
+            return
+
+        other = self.channel_effects[1 - channel]
+        other_index = other.effect_index if other else self.current_effect_index
+        if color is None and other_index == index:
+            self.channel_effects[channel] = other
+        else:
+            channel_effect = ChannelEffect(effect, index, config.NUM_LEDS, FRAME_CACHE_BYTES, FULL_REDRAW_FRAMES)
+            if color:
+                channel_effect.effect.set_color(color)
+            self.channel_effects[channel] = channel_effect
+
+        self.update_fps()
+        self.state.set(CHANNEL_EFFECT_STATE_TOPIC % channel, effect_name)
+
+
+    def make_layer(self, spec):
+        for index, effect in enumerate(self.effect_list):
+            if effect.name == spec["effect"]:
+                break
+        else:
+            raise ValueError("Unknown effect %s" % spec["effect"])
+
+        fps = spec.get("fps")
+        if fps is not None:
+            if isinstance(fps, bool) or not isinstance(fps, (int, float)):
+                raise TypeError("Layer fps must be a number")
+            if fps < 0:
+                raise ValueError("Layer fps must be 0 or more")
+
+        color = spec.get("color")
+        if color:
+            color = tuple(color)
+            if len(color) != 3 or not all(isinstance(c, int) and 0 <= c <= 255 for c in color):
+                raise ValueError("Invalid layer color %s" % (color,))
+
+        channel_effect = ChannelEffect(effect, index, config.NUM_LEDS, FRAME_CACHE_BYTES, FULL_REDRAW_FRAMES, fps)
+        if color:
+            channel_effect.effect.set_color(color)
+
+        return Layer(channel_effect, spec.get("blend", "max"), spec.get("opacity", 1.0))
+
+
+    def set_layers(self, specs):
+        ''' Replace the layers drawn on top of the channels. Nothing changes if any of them is no good. '''
+
+        try:
+            layers = [ self.make_layer(spec) for spec in specs ]
+        except (ValueError, KeyError, TypeError) as err:
+            print("Invalid layers: %s" % err)
+            return
+
+        print("layers: %s" % ", ".join(layer.name for layer in layers))
+        self.compositor.layers = layers
+        self.update_fps()
+        self.state.set(LAYERS_STATE_TOPIC, json.dumps([ layer.state() for layer in layers ]))
+
+
+    def layer_effects(self):
+        return [ layer.channel_effect for layer in self.compositor.layers ]
+
+
+    def transition_effects(self):
+        return self.transition.effects() if self.transition else []
+
+
+    def unique_channel_effects(self):
+        effects = []
+        for channel_effect in self.channel_effects:
+            if channel_effect and channel_effect not in effects:
+                effects.append(channel_effect)
+        return effects
+
+
+    def background_effects(self):
+        ''' Everything that renders on the render pool: single channel effects, layers and the
+            outgoing side of a crossfade '''
+        return self.unique_channel_effects() + self.layer_effects() + self.transition_effects()
+
+
+    def shared_effect_shown(self):
+        return not all(self.channel_effects)
+
+
+    def update_fps(self):
+        ''' Tick as fast as the fastest effect that is on show needs, and at least FADE_FPS while fading '''
+
+        fps = [ channel_effect.fps for channel_effect in self.background_effects() if channel_effect.fps ]
+        if self.current_effect and self.shared_effect_shown():
+            fps.append(self.current_effect.FPS)
+        if self.transition or self.fade.running():
+            fps.append(FADE_FPS)
+        if fps and max(fps) != self.scheduler.fps:
+            self.scheduler.set_fps(max(fps))
 
 
     def add_effect(self, effect):
         self.effect_list.append(effect)
         if len(self.effect_list) == 1:
-            self.current_effect = effect 
-            self.current_effect.setup()
-            self.current_effect_index = 0
+            self.activate_effect(0)
+
+
+    def _effect_index(self):
+        # If we're in the middle of switching, step from where we're going, not where we were
+        if self.pending_effect is not None:
+            return self.pending_effect[0]
+        return self.current_effect_index
 
 
     def next_effect(self):
-        if self.brightness:
-            index = (self.current_effect_index + 1) % len(self.effect_list)
+        if self.brightness or self.pending_effect is not None:
+            index = (self._effect_index() + 1) % len(self.effect_list)
             self.set_effect(str(self.effect_list[index].name))
 
 
     def previous_effect(self):
-        if self.brightness:
-            index = (self.current_effect_index + len(self.effect_list) - 1) % len(self.effect_list)
+        if self.brightness or self.pending_effect is not None:
+            index = (self._effect_index() + len(self.effect_list) - 1) % len(self.effect_list)
             self.set_effect(str(self.effect_list[index].name))
 
 
@@ -228,6 +641,9 @@ class Lips(object):
         if self.brightness and self.current_effect:
             print("nudge effect")
             self.current_effect.nudge()
+            self.renderer.invalidate()
+            for channel_effect in self.unique_channel_effects():
+                channel_effect.nudge()
 
     def startup(self):
 
@@ -244,129 +660,113 @@ class Lips(object):
 
     @staticmethod
     def on_message(mqttc, user_data, msg):
+        received = monotonic()
+        lips = mqttc.__led
         try:
-            mqttc.__led._handle_message(mqttc, msg)
+            lips._handle_message(mqttc, msg, received)
         except Exception as err:
             traceback.print_exc(file=sys.stdout)
 
+        if lips.metrics.enabled:
+            lips.metrics.add("mqtt", monotonic() - received)
 
-    def _handle_message(self, mqttc, msg):
 
-        payload = str(msg.payload, 'utf-8')
-        if msg.topic == COMMAND_TOPIC:
-            if msg.payload.lower() == b"mode":
-                self.next_effect()
-                return
+    def _handle_message(self, mqttc, msg, received):
+        ''' Runs on the MQTT thread: turn the message into commands for the render loop, never touch the strips here '''
 
-            if msg.payload.lower() == b"on":
-                self.turn_on()
-                return
+        text = str(msg.payload, 'utf-8')
+        action = text.strip().lower()
+        for handler in self.router.match(msg.topic):
+            for command in handler(text, action, received):
+                self.commands.put(command)
 
-            if msg.payload.lower() == b"off":
-                self.turn_off()
-                return
 
-            if msg.payload.lower() == b"toggle":
-                if self.brightness:
-                    self.turn_off()
-                    return
-                else:
-                    self.turn_on()
-                    return
+    def setup_routes(self):
+        self.router = TopicRouter()
+        self.router.add(COMMAND_TOPIC, partial(self._action_message, "command", self._make_actions(COMMAND_ACTIONS)))
+        self.router.add(BRIGHTNESS_TOPIC, self._brightness_message)
+        self.router.add(EFFECT_TOPIC, self._effect_message)
+        for channel in (CHANNEL_0, CHANNEL_1):
+            self.router.add(CHANNEL_EFFECT_TOPIC % channel, partial(self._channel_effect_message, channel))
+        self.router.add(COLOR_TOPIC, self._color_message)
+        self.router.add(METRICS_ENABLE_TOPIC, self._metrics_message)
+        self.router.add(LAYERS_TOPIC, self._layers_message)
+        for dimmer in DIMMERS:
+            actions = self._make_actions(dimmer.get("actions", HUE_DIMMER_ACTIONS))
+            self.router.add(dimmer["topic"], partial(self._action_message, dimmer["name"], actions))
 
-            return
 
-        if msg.topic == BRIGHTNESS_TOPIC:
-            try:
-                self.set_brightness(int(msg.payload))
-            except ValueError:
-                pass
-            return
-  
-        if msg.topic == EFFECT_TOPIC:
-            effect = str(msg.payload, 'utf-8')
-            try:
-                self.set_effect(effect)
-            except ValueError:
-                print("Invalid effect: '%s'" % effect)
-            return
-        
-        if msg.topic == COLOR_TOPIC:
-            color = (int(msg.payload[1:3], 16),int(msg.payload[3:5], 16),int(msg.payload[5:7], 16))
-            self.current_effect.set_color(color)
-            self.publish(COLOR_STATE_TOPIC, msg.payload)
-            return
-           
-        for dimmer in DIMMERS:
-            if msg.topic == dimmer["topic"]:
-                action = str(msg.payload, 'utf-8')
-                print("===== %s" % action)
-                
-                if msg.payload.lower() == b"on-press":
-                    if dimmer["name"] == "bed": 
-                        self.turn_on()
-                    else:
-                        for i, effect in enumerate(self.effect_list):
-                            if effect.name == "solid":
-                                self.turn_off()
-                                self.current_effect = effect 
-                                self.current_effect.setup()
-                                self.current_effect_index = i
-                                effect.set_color((255, 180, 59))
-                                self.set_brightness(100)
-                                break
-
-                    return
-
-                if msg.payload.lower() == b"on-hold":
-                    if dimmer["name"] == "bed": 
-                        while self.brightness < 100:
-                            self.set_brightness(self.brightness + 10)
-                    else:
-                        for i, effect in enumerate(self.effect_list):
-                            if effect.name == "bedtime":
-                                self.turn_off()
-                                self.current_effect = effect 
-                                self.current_effect.setup()
-                                self.current_effect_index = i
-                                self.set_brightness(50)
-                                break
-                    return
-
-                if msg.payload.lower() == b"off-press":
-                    self.turn_off()
-                    return
-
-                if msg.payload.lower() == b"up-press":
-                    self.brightness_up()
-                    return
-
-                if msg.payload.lower() == b"down-press":
-                    self.brightness_down()
-                    return
-
-                if msg.payload.lower() == b"up-hold":
-                    self.next_effect()
-                    return
-
-                if msg.payload.lower() == b"down-hold":
-                    self.previous_effect()
-                    return
-
-                if msg.payload.lower() == b"off-hold":
-                    if dimmer["name"] == "bed": 
-                        self.nudge_effect()
-                    else:
-                        for i, effect in enumerate(self.effect_list):
-                            if effect.name == "bedtime":
-                                self.turn_off()
-                                self.current_effect = effect 
-                                self.current_effect.setup()
-                                self.current_effect_index = i
-                                self.set_brightness(5)
-                                break
-                    return
-        
+    def _make_actions(self, actions):
+        return { action.lower() : commands.make_action(spec) for action, spec in actions.items() }
+
+
+    def _action_message(self, name, actions, text, action, received):
+        print("===== %s: %s" % (name, text))
+
+        try:
+            return [ actions[action](received) ]
+        except KeyError:
+            return []
+
+
+    def _brightness_message(self, text, action, received):
+        try:
+            return [ commands.SetBrightness(int(text), received=received) ]
+        except ValueError:
+            return []
+
+
+    def _effect_message(self, text, action, received):
+        return [ commands.SetEffect(text, received=received) ]
+
+
+    def _channel_effect_message(self, channel, text, action, received):
+        return [ commands.SetEffect(text, received=received, channel=channel) ]
+
+
+    def _color_message(self, text, action, received):
+        try:
+            color = (int(text[1:3], 16), int(text[3:5], 16), int(text[5:7], 16))
+        except ValueError:
+            print("Invalid color: '%s'" % text)
+            return []
+
+        return [ commands.SetColor(color, text, received) ]
+
+
+    def _metrics_message(self, text, action, received):
+        if action not in ("on", "off", "1", "0"):
+            return []
+
+        return [ commands.SetMetrics(action in ("on", "1"), received) ]
+
+
+    def _layers_message(self, text, action, received):
+        try:
+            specs = json.loads(text) if text.strip() else []
+        except ValueError:
+            print("Invalid layers: '%s'" % text)
+            return []
+
+        if not isinstance(specs, list):
+            print("Invalid layers: '%s'" % text)
+            return []
+
+        return [ commands.SetLayers(specs, received) ]
+
+
+    def set_metrics(self, enabled):
+        print("metrics %s" % ("on" if enabled else "off"))
+        self.metrics.enable(enabled)
+
+
+    def publish_metrics(self):
+        summary = self.metrics.summary()
+        summary["scheduler"] = self.scheduler.stats()
+        summary["commands"] = self.commands.stats()
+        summary["command_latency"] = self.commands.latency_summary()
+        self.publish(METRICS_TOPIC, json.dumps(summary))
+
 
     def setup(self):
         #self.startup()
@@ -383,34 +783,109 @@ class Lips(object):
             print("adding effect %s" % effect.name)
             effect_name_list.append(effect.name)
 
-        self.mqttc.subscribe(COMMAND_TOPIC)
-        self.mqttc.subscribe(BRIGHTNESS_TOPIC)
-        self.mqttc.subscribe(EFFECT_TOPIC)
-        self.mqttc.subscribe(COLOR_TOPIC)
-        for dimmer in DIMMERS:
-            self.mqttc.subscribe(dimmer["topic"])
+        for topic_filter in self.router.filters():
+            self.mqttc.subscribe(topic_filter)
 
+        self.state.set(STATE_TOPIC, "1" if self.brightness else "0")
+        self.state.set(BRIGHTNESS_STATE_TOPIC, "%d" % self.brightness)
+        self.set_layers(LAYERS)
 
-    def loop(self):
-        if self.current_effect and self.brightness:
+
+    def render_effect(self, effect, t):
+        self.renderer.render(effect, t)
+
+
+    def render_frame(self, now):
+        ''' Render everything that is on show. The background effects are rendered on the render pool,
+            alongside the shared effect. Returns True if a legacy effect already called show() itself. '''
+
+        jobs = [ self.render_pool.submit(channel_effect.render, now)
+                 for channel_effect in self.background_effects() if channel_effect.due(now) ]
+
+        legacy = False
+        if self.shared_effect_shown() and now >= self.effect_next_frame:
+            if self.current_effect.time_based:
+                self.render_effect(self.current_effect, now - self.effect_start)
+            else:
+                legacy = True
+
+            # We may be ticking faster than the effect runs, to keep a fade smooth
+            period = 1.0 / self.current_effect.FPS
+            self.effect_next_frame += period
+            if self.effect_next_frame <= now:
+                self.effect_next_frame = now + period
+
+        for job in jobs:
+            job.result()
+
+        # Legacy effects show their own frames, so they have to wait for the others to be done
+        if legacy:
             self.current_effect.loop()
 
-            # If we come out of an update loop and we got turned off, oops. clean up
-            if not self.brightness:
-                self.clear()
+        return legacy
+
+
+    def loop(self):
+        self.commands.apply(self)
+        self.apply_brightness(self.fade.value())
+
+        # A pending effect switch happens once we've faded out, or right away if we got retargeted
+        if self.pending_effect is not None and (not self.output_brightness or self.brightness):
+            self._switch_pending_effect()
+
+        self.state.flush()
+
+        metrics = self.metrics.enabled
+        if metrics and self.metrics.due():
+            self.publish_metrics()
+
+        if not self.current_effect or (not self.output_brightness and not self.brightness):
+            # Nothing is being output, so whatever was just applied has taken effect already
+            self.commands.frame_shown()
+            delay = self.state.flush_delay()
+            self.scheduler.idle(IDLE_TIMEOUT if delay is None else min(delay, IDLE_TIMEOUT), self.commands.pending)
+            return
+
+        now = monotonic()
+        if self.transition and not self.transition.update(now):
+            self.transition = None
+        self.update_fps()
+
+        if metrics:
+            start = perf_counter()
+            shown = self.render_frame(now)
+            self.metrics.add("render", perf_counter() - start)
+        else:
+            shown = self.render_frame(now)
+
+        if not shown:
+            self.show()
+
+        if metrics:
+            start = perf_counter()
+            self.scheduler.wait_for_frame()
+            self.metrics.add("sleep", perf_counter() - start)
+        else:
+            self.scheduler.wait_for_frame()
+
+
+def add_effects(a):
+    ''' Register the EFFECTS. Effects whose module isn't there or doesn't import are skipped. '''
+
+    for module_name, class_name, args in EFFECTS:
+        try:
+            module = importlib.import_module("effect." + module_name)
+        except ImportError as err:
+            print("skipping effect %s: %s" % (module_name, err))
+            continue
+
+        a.add_effect(getattr(module, class_name)(a, *args))
 
 
 if __name__ == "__main__":
     seed()
     a = Lips()
-    a.add_effect(color_amble_effect.ColorAmbleEffect(a))
-    a.add_effect(solid_effect.SolidEffect(a))
-    a.add_effect(chill_bed_time_effect.ChillBedTimeEffect(a))
-    a.add_effect(sparkle_effect.SparkleEffect(a))
-    a.add_effect(dynamic_colorcycle_effect.DynamicColorCycleEffect(a))
-    a.add_effect(undulating_effect.UndulatingEffect(a))
-    a.add_effect(bootie_call_effect.BootieCallEffect(a, .0005))
-    a.add_effect(test_effect.TestEffect(a))
+    add_effects(a)
 
     a.setup()
     if config.TURN_ON_AT_START:
@@ -418,8 +893,8 @@ if __name__ == "__main__":
     try:
         while True:
             a.loop()
-            sleep(.0001)
     except KeyboardInterrupt:
-        a.turn_off()
+        a.turn_off(0.0)
+        a.loop()
         a.mqttc.disconnect()
         a.mqttc.loop_stop()
@@ -0,0 +1,109 @@
+from bisect import bisect_left
+from time import monotonic
+
+# Upper bounds of the histogram buckets in seconds, plus one bucket for anything slower
+BUCKETS = (50e-6, 100e-6, 200e-6, 500e-6, 1e-3, 2e-3, 5e-3, 10e-3, 20e-3, 50e-3, 100e-3, 200e-3)
+
+DEFAULT_INTERVAL = 10.0
+
+
+class Histogram(object):
+    '''
+        Durations counted into fixed buckets. Adding a value is a bisect and a couple of
+        additions, so this can be left running on every frame.
+    '''
+
+    __slots__ = ("bounds", "counts", "count", "total", "max")
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+
+    def percentile(self, percent):
+        ''' Upper bound of the bucket the percentile falls in, capped at the largest value seen '''
+
+        if not self.count:
+            return 0.0
+
+        rank = self.count * percent / 100.0
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                break
+
+        return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+
+
+    def summary(self):
+        ''' Count, times in microseconds and the bucket counts '''
+
+        return { "count" : self.count,
+                 "avg_us" : round(self.total / self.count * 1e6, 1) if self.count else 0.0,
+                 "max_us" : round(self.max * 1e6, 1),
+                 "p50_us" : round(self.percentile(50) * 1e6, 1),
+                 "p90_us" : round(self.percentile(90) * 1e6, 1),
+                 "p99_us" : round(self.percentile(99) * 1e6, 1),
+                 "buckets" : list(self.counts) }
+
+
+class Metrics(object):
+    '''
+        A fixed set of named histograms that are summarized and started over every interval
+        seconds. Each histogram should only be added to from one thread.
+    '''
+
+    def __init__(self, names, interval=DEFAULT_INTERVAL, bounds=BUCKETS):
+        self.enabled = False
+        self.interval = interval
+        self.bounds = bounds
+        self.histograms = { name : Histogram(bounds) for name in names }
+        self.started = monotonic()
+
+
+    def enable(self, enabled):
+        if enabled and not self.enabled:
+            self.reset()
+        self.enabled = enabled
+
+
+    def add(self, name, value):
+        self.histograms[name].add(value)
+
+
+    def reset(self, now=None):
+        for name in self.histograms:
+            self.histograms[name] = Histogram(self.bounds)
+        self.started = now if now is not None else monotonic()
+
+
+    def due(self, now=None):
+        if now is None:
+            now = monotonic()
+        return now - self.started >= self.interval
+
+
+    def summary(self, now=None):
+        ''' Summarize everything since the last summary and start over '''
+
+        if now is None:
+            now = monotonic()
+
+        summary = { name : histogram.summary() for name, histogram in self.histograms.items() }
+        summary["interval"] = round(now - self.started, 3)
+        summary["bucket_bounds_us"] = [ round(bound * 1e6, 1) for bound in self.bounds ]
+        self.reset(now)
+
+        return summary
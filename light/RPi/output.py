@@ -0,0 +1,79 @@
+from array import array
+
+from gamma import GAMMA_TABLE
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Brightness levels, as set by Lips.set_brightness()
+MAX_LEVEL = 100
+
+
+def channel_value(value, level, gamma, balance):
+    ''' What one 8 bit color channel becomes at a brightness level. Scales like rpi_ws281x does
+        with setBrightness(level), so frames come out as they did before there was an output stage. '''
+
+    if gamma:
+        value = GAMMA_TABLE[value]
+    value = min(int(value * balance + .5), 255)
+    return (value * (level + 1)) >> 8 if level else 0
+
+
+class OutputStage(object):
+    '''
+        The last step before a frame goes to a strip: gamma, brightness and per channel color
+        balance, all in one table lookup per color channel. Tables for every brightness level
+        are worked out up front, so a brightness change just picks a different table.
+    '''
+
+    def __init__(self, gamma=False, balance=(1.0, 1.0, 1.0)):
+        self.level = 0
+
+        # tables[level][channel][value], already shifted into place in a 0xRRGGBB word
+        tables = []
+        for level in range(MAX_LEVEL + 1):
+            tables.append([ [ channel_value(value, level, gamma, balance[channel]) << shift for value in range(256) ]
+                            for channel, shift in ((0, 16), (1, 8), (2, 0)) ])
+
+        if np is not None:
+            self.tables = np.array(tables, dtype=np.uint32)
+        else:
+            self.tables = tables
+
+
+    def set_level(self, level):
+        self.level = min(max(int(level), 0), MAX_LEVEL)
+
+
+    def apply(self, source, dest):
+        ''' Write source, corrected for the current level, into dest. Returns dest. Both strips
+            can be doing this at the same time, so the scratch space is our own. '''
+
+        red, green, blue = self.tables[self.level]
+        pixels = source.pixels
+
+        if np is None:
+            dest.pixels[:] = array('I', [ red[(word >> 16) & 0xFF] | green[(word >> 8) & 0xFF] | blue[word & 0xFF]
+                                          for word in pixels ])
+            return dest
+
+        index = np.empty_like(pixels)
+        channel = np.empty_like(pixels)
+        out = dest.pixels
+
+        np.right_shift(pixels, 16, out=index)
+        np.bitwise_and(index, 0xFF, out=index)
+        np.take(red, index, out=out)
+
+        np.right_shift(pixels, 8, out=index)
+        np.bitwise_and(index, 0xFF, out=index)
+        np.take(green, index, out=channel)
+        np.bitwise_or(out, channel, out=out)
+
+        np.bitwise_and(pixels, 0xFF, out=index)
+        np.take(blue, index, out=channel)
+        np.bitwise_or(out, channel, out=out)
+
+        return dest
@@ -0,0 +1,69 @@
+from time import monotonic
+
+DEFAULT_MAX_RATE = 2.0
+
+
+class StatePublisher(object):
+    '''
+        Collects state updates and publishes them as retained messages, at most max_rate
+        times per second. Only the latest value for each topic goes out, and values that
+        haven't changed since the last time they were published are not sent again.
+    '''
+
+    def __init__(self, publish, max_rate=DEFAULT_MAX_RATE):
+        self.publish = publish
+        self.interval = 1.0 / max_rate
+        self.published = {}
+        self.dirty = {}
+        self.last_flush = None
+
+        self.messages_published = 0
+        self.updates_suppressed = 0
+
+
+    def set(self, topic, payload):
+        if self.published.get(topic) == payload:
+            if self.dirty.pop(topic, None) is not None:
+                self.updates_suppressed += 1
+            return
+
+        if topic in self.dirty:
+            self.updates_suppressed += 1
+        self.dirty[topic] = payload
+
+
+    def flush_delay(self, now=None):
+        ''' Seconds until flush() will publish the dirty state, or None if nothing is dirty '''
+
+        if not self.dirty:
+            return None
+
+        if self.last_flush is None:
+            return 0.0
+
+        if now is None:
+            now = monotonic()
+
+        return max(self.last_flush + self.interval - now, 0.0)
+
+
+    def flush(self, now=None):
+        if now is None:
+            now = monotonic()
+
+        delay = self.flush_delay(now)
+        if delay is None or delay > 0.0:
+            return
+
+        for topic, payload in self.dirty.items():
+            self.publish(topic, payload, True)
+            self.published[topic] = payload
+            self.messages_published += 1
+
+        self.dirty = {}
+        self.last_flush = now
+
+
+    def stats(self):
+        return { "published" : self.messages_published,
+                 "suppressed" : self.updates_suppressed }
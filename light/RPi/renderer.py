@@ -0,0 +1,78 @@
+from framebuffer import FrameCache
+
+DEFAULT_CACHE_BYTES = 1024 * 1024
+DEFAULT_FULL_REDRAW_FRAMES = 60
+
+
+class EffectRenderer(object):
+    '''
+        Draws an effect's frames into led_art's draw_frames. Periodic effects are replayed from a
+        frame cache once their cycle has been rendered, scrolling effects get the last frame moved
+        along and only the LEDs that scrolled into view rendered.
+    '''
+
+    def __init__(self, led_art, num_leds, cache_bytes=DEFAULT_CACHE_BYTES, full_redraw_frames=DEFAULT_FULL_REDRAW_FRAMES):
+        self.led_art = led_art
+        self.num_leds = num_leds
+        self.full_redraw_frames = full_redraw_frames
+        self.frame_cache = FrameCache(cache_bytes)
+        self.scroll_dirty = True
+        self.scroll_remainder = 0.0
+        self.scroll_frames = 0
+
+
+    def invalidate(self):
+        ''' The effect changed, so cached frames and the last frame are no good anymore '''
+        self.frame_cache.clear()
+        self.scroll_dirty = True
+
+
+    def render(self, effect, t):
+        if effect.SCROLLING:
+            self.render_scrolling(effect, t)
+            return
+
+        if not effect.PERIODIC_FRAMES:
+            effect.render(t)
+            return
+
+        index = effect.frame_index(t)
+        frames = self.frame_cache.get(index)
+        if frames is None:
+            effect.render(t)
+            self.frame_cache.put(index, self.led_art.draw_frames)
+            return
+
+        for fb, frame in zip(self.led_art.draw_frames, frames):
+            fb.set_frame(frame)
+
+
+    def render_scrolling(self, effect, t):
+        ''' Move the last frame along by the whole LEDs the effect scrolled and only render the ones
+            that came into view. The fraction of an LED that is left over is carried to the next frame. '''
+
+        num_leds = self.num_leds
+        shift = self.scroll_remainder + effect.scroll(t)
+        whole = int(round(shift))
+        self.scroll_frames += 1
+
+        try:
+            if self.scroll_dirty or abs(whole) >= num_leds or self.scroll_frames >= self.full_redraw_frames:
+                self.led_art.set_frame(effect.render_pixels(0, num_leds))
+                self.scroll_dirty = False
+                self.scroll_remainder = 0.0
+                self.scroll_frames = 0
+                return
+
+            remainder = shift - whole
+            start, end = (0, whole) if whole >= 0 else (num_leds + whole, num_leds)
+            pixels = effect.render_pixels(start, end, remainder) if whole else None
+        except (ValueError, IndexError):
+            self.scroll_dirty = True
+            return
+
+        for fb in self.led_art.draw_frames:
+            fb.shift(whole)
+            if pixels is not None:
+                fb.set_pixels(start, pixels)
+        self.scroll_remainder = remainder
@@ -0,0 +1,72 @@
+class _Node(object):
+
+    __slots__ = ("children", "handlers")
+
+    def __init__(self):
+        self.children = {}
+        self.handlers = []
+
+
+class TopicRouter(object):
+    '''
+        Maps MQTT topics to handlers. Plain topics are a single dict lookup, filters with
+        + or # wildcards are matched level by level through a trie.
+    '''
+
+    def __init__(self):
+        self.exact = {}
+        self.wildcards = _Node()
+        self.topic_filters = []
+
+
+    def add(self, topic_filter, handler):
+        if topic_filter not in self.topic_filters:
+            self.topic_filters.append(topic_filter)
+
+        levels = topic_filter.split("/")
+        if "+" not in levels and "#" not in levels:
+            self.exact.setdefault(topic_filter, []).append(handler)
+            return
+
+        if "#" in levels[:-1]:
+            raise ValueError("# must be the last level of a topic filter: %s" % topic_filter)
+
+        node = self.wildcards
+        for level in levels:
+            node = node.children.setdefault(level, _Node())
+        node.handlers.append(handler)
+
+
+    def filters(self):
+        ''' The topic filters to subscribe to '''
+        return list(self.topic_filters)
+
+
+    def match(self, topic):
+        handlers = self.exact.get(topic, [])
+        if self.wildcards.children:
+            wildcard_handlers = []
+            self._match(self.wildcards, topic.split("/"), 0, wildcard_handlers)
+            if wildcard_handlers:
+                handlers = handlers + wildcard_handlers
+
+        return handlers
+
+
+    def _match(self, node, levels, index, handlers):
+
+        multi = node.children.get("#")
+        if multi:
+            handlers.extend(multi.handlers)
+
+        if index == len(levels):
+            handlers.extend(node.handlers)
+            return
+
+        child = node.children.get(levels[index])
+        if child:
+            self._match(child, levels, index + 1, handlers)
+
+        single = node.children.get("+")
+        if single:
+            self._match(single, levels, index + 1, handlers)
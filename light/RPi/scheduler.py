@@ -0,0 +1,106 @@
+from threading import Event
+from time import monotonic
+
+DEFAULT_FPS = 30
+
+# How long to nap when nothing is being rendered, unless woken up early
+IDLE_TIMEOUT = 1.0
+
+
+class FrameScheduler(object):
+    '''
+        Paces the render loop against fixed monotonic deadlines. Deadlines advance by exactly one
+        frame period, so time spent rendering doesn't accumulate as drift. If we fall a whole frame
+        or more behind, those frames are skipped rather than rendered back to back to catch up.
+    '''
+
+    def __init__(self, fps=DEFAULT_FPS, coalesce_fps=DEFAULT_FPS):
+        self.wakeup = Event()
+        self.coalesce_period = 1.0 / coalesce_fps
+        self.coalesce_until = None
+        self.idling = False
+        self.deadline = None
+        self.set_fps(fps)
+
+        self.frames_rendered = 0
+        self.frames_dropped = 0
+        self.frames_late = 0
+
+
+    def set_fps(self, fps):
+        self.fps = fps
+        self.period = 1.0 / fps
+        self.deadline = None
+
+
+    def reset(self):
+        ''' Start counting deadlines from the next frame, e.g. after being idle '''
+        self.deadline = None
+
+
+    def wait_for_frame(self):
+        ''' Block until the next frame is due. Call once after rendering each frame. '''
+
+        now = monotonic()
+        if self.deadline is None:
+            self.deadline = now + self.period
+
+        delay = self.deadline - now
+        if delay > 0:
+            if self.wakeup.wait(delay):
+                # Woken up early, most likely by a command. Show it now but keep our cadence.
+                self.wakeup.clear()
+
+                # Commands that coalesce get a little while for more of the same to arrive first
+                if self.coalesce_until is not None:
+                    rest = min(self.coalesce_until, self.deadline) - monotonic()
+                    if rest > 0 and self.wakeup.wait(rest):
+                        self.wakeup.clear()
+                    self.coalesce_until = None
+
+                self.frames_rendered += 1
+                return
+        elif delay < 0:
+            self.frames_late += 1
+            behind = int(-delay / self.period)
+            if behind:
+                self.frames_dropped += behind
+                self.deadline += behind * self.period
+
+        self.deadline += self.period
+        self.frames_rendered += 1
+
+
+    def idle(self, timeout=IDLE_TIMEOUT, pending=None):
+        ''' Sleep while there is nothing to render. wake() cuts this short, as it does wait_for_frame().
+            Once we count as idle, pending() is asked if anything came in before that, in which case
+            we don't sleep at all. '''
+
+        self.idling = True
+        if pending is None or not pending():
+            self.wakeup.wait(timeout)
+        self.idling = False
+        self.wakeup.clear()
+        self.coalesce_until = None
+        self.deadline = None
+
+
+    def wake(self):
+        self.wakeup.set()
+
+
+    def wake_idle(self):
+        ''' Like wake(), but only if we're idle. Doesn't cut a frame short, unless frames are further
+            apart than coalesce_period, in which case the frame comes coalesce_period from now. '''
+        if self.idling:
+            self.wakeup.set()
+        elif self.period > self.coalesce_period and self.coalesce_until is None:
+            self.coalesce_until = monotonic() + self.coalesce_period
+            self.wakeup.set()
+
+
+    def stats(self):
+        return { "fps" : self.fps,
+                 "rendered" : self.frames_rendered,
+                 "dropped" : self.frames_dropped,
+                 "late" : self.frames_late }
@@ -0,0 +1,212 @@
+import atexit
+from time import perf_counter, sleep
+
+# Roughly how long a WS2812 takes to clock in one LED at 800kHz: 24 bits at 1.25us each
+LED_WIRE_TIME = 30e-6
+
+# How many shown frames the recording strip hangs on to
+RECORD_FRAMES = 1000
+
+
+class _LedData(object):
+    ''' Stand in for the driver's LED array, so that FrameBuffer.push() works the same way '''
+
+    def __init__(self, num_leds):
+        self.leds = [0] * num_leds
+
+    def __getitem__(self, pos):
+        return self.leds[pos]
+
+    def __setitem__(self, pos, value):
+        self.leds[pos] = value
+
+
+class NullStrip(object):
+    '''
+        A strip that isn't there. Has the parts of the Adafruit_NeoPixel interface that Lips uses,
+        so effects can be run and measured without a Raspberry Pi or rpi_ws281x.
+    '''
+
+    def __init__(self, num_leds):
+        self.num_leds = num_leds
+        self.brightness = 0
+        self._led_data = _LedData(num_leds)
+        self.shows = 0
+
+
+    def begin(self):
+        pass
+
+
+    def show(self):
+        self.shows += 1
+
+
+    def setPixelColor(self, n, color):
+        self._led_data[n] = color
+
+
+    def getPixelColor(self, n):
+        return self._led_data[n]
+
+
+    def setBrightness(self, brightness):
+        self.brightness = brightness
+
+
+    def getBrightness(self):
+        return self.brightness
+
+
+    def numPixels(self):
+        return self.num_leds
+
+
+class RecordingStrip(NullStrip):
+    '''
+        A null strip that keeps the frames that were shown and models the time it takes to send a
+        frame down the wire. Like the driver, show() doesn't return until the frame has gone out.
+        Unlike the driver it sleeps meanwhile, so other threads get to run.
+    '''
+
+    def __init__(self, num_leds, led_wire_time=LED_WIRE_TIME, max_frames=RECORD_FRAMES):
+        NullStrip.__init__(self, num_leds)
+        self.frame_time = num_leds * led_wire_time
+        self.max_frames = max_frames
+        self.frames = []
+        self.wire_time = 0.0
+
+
+    def show(self):
+        start = perf_counter()
+        if len(self.frames) < self.max_frames:
+            self.frames.append((self.brightness, list(self._led_data.leds)))
+
+        sleep(max(self.frame_time - (perf_counter() - start), 0.0))
+        self.wire_time += perf_counter() - start
+        self.shows += 1
+
+
+class WS281xDriver(object):
+    '''
+        Both channels of the Pi's PWM on one rpi_ws281x ws2811_t. A single ws2811_render() sends the
+        two strips out at the same time, over the one DMA channel they share, which two separate
+        Adafruit_NeoPixel objects can't do.
+    '''
+
+    def __init__(self, num_leds, pins, freq_hz=800000, dma=10, strip_type=None):
+        from neopixel import ws
+
+        self.ws = ws
+        self.leds = ws.new_ws2811_t()
+        self.started = False
+
+        for index in range(2):
+            channel = ws.ws2811_channel_get(self.leds, index)
+            ws.ws2811_channel_t_count_set(channel, num_leds if index < len(pins) else 0)
+            ws.ws2811_channel_t_gpionum_set(channel, pins[index] if index < len(pins) else 0)
+            ws.ws2811_channel_t_invert_set(channel, 0)
+            ws.ws2811_channel_t_brightness_set(channel, 255)
+            if strip_type is not None:
+                ws.ws2811_channel_t_strip_type_set(channel, strip_type)
+
+        ws.ws2811_t_freq_set(self.leds, freq_hz)
+        ws.ws2811_t_dmanum_set(self.leds, dma)
+        atexit.register(self.cleanup)
+
+
+    def channel(self, index):
+        return self.ws.ws2811_channel_get(self.leds, index)
+
+
+    def begin(self):
+        if self.started:
+            return
+
+        self._check(self.ws.ws2811_init(self.leds), "ws2811_init")
+        self.started = True
+
+
+    def render(self):
+        self._check(self.ws.ws2811_render(self.leds), "ws2811_render")
+
+
+    def cleanup(self):
+        if self.leds is not None:
+            if self.started:
+                self.ws.ws2811_fini(self.leds)
+            self.ws.delete_ws2811_t(self.leds)
+            self.leds = None
+
+
+    def _check(self, resp, call):
+        if resp != 0:
+            raise RuntimeError("%s failed with code %d (%s)" % (call, resp, self.ws.ws2811_get_return_t_str(resp)))
+
+
+class DriverStrip(object):
+    '''
+        One channel of a WS281xDriver, with the parts of the Adafruit_NeoPixel interface that Lips
+        uses. show() sends both channels, Lips shows a pair with a single call.
+    '''
+
+    def __init__(self, driver, index, num_leds):
+        from neopixel import _LED_Data
+
+        self.driver = driver
+        self.num_leds = num_leds
+        self._channel = driver.channel(index)
+        self._led_data = _LED_Data(self._channel, num_leds)
+
+
+    def begin(self):
+        self.driver.begin()
+
+
+    def show(self):
+        self.driver.render()
+
+
+    def setPixelColor(self, n, color):
+        self._led_data[n] = color
+
+
+    def getPixelColor(self, n):
+        return self._led_data[n]
+
+
+    def setBrightness(self, brightness):
+        self.driver.ws.ws2811_channel_t_brightness_set(self._channel, brightness)
+
+
+    def getBrightness(self):
+        return self.driver.ws.ws2811_channel_t_brightness_get(self._channel)
+
+
+    def numPixels(self):
+        return self.num_leds
+
+
+def make_strips(backend, num_leds, pins):
+    ''' Create a strip for each of the pins. backend is "neopixel" for the real thing, with all the
+        strips on one driver, "neopixel-serial" for an Adafruit_NeoPixel per strip, shown one
+        after the other, or "null" or "recording" to run without hardware. '''
+
+    if backend == "null":
+        return [ NullStrip(num_leds) for pin in pins ]
+
+    if backend == "recording":
+        return [ RecordingStrip(num_leds) for pin in pins ]
+
+    if backend not in ("neopixel", "neopixel-serial"):
+        raise ValueError("Unknown strip backend %s" % backend)
+
+    from neopixel import Adafruit_NeoPixel, ws
+
+    # Frames are packed as 0xRRGGBB, so let the driver do the GRB reordering for the wire
+    if backend == "neopixel":
+        driver = WS281xDriver(num_leds, pins, strip_type=ws.WS2811_STRIP_GRB)
+        return [ DriverStrip(driver, channel, num_leds) for channel in range(len(pins)) ]
+
+    return [ Adafruit_NeoPixel(num_leds, pin, 800000, 10, False, 0, channel, ws.WS2811_STRIP_GRB)
+             for channel, pin in enumerate(pins) ]
@@ -0,0 +1,42 @@
+from framebuffer import FrameBuffer
+from fade import Fade, ease_in_out
+from compositor import blend
+
+
+class Transition(object):
+    '''
+        A crossfade from what the channels showed before an effect switch to the new effect.
+        The outgoing effects are ChannelEffects, one per channel (both can be the same one), that
+        keep rendering on their own until the new effect has faded all the way in.
+    '''
+
+    def __init__(self, outgoing, duration, num_leds, easing=ease_in_out, now=None):
+        self.outgoing = outgoing
+        self.fade = Fade(0.0, easing)
+        self.fade.start(1.0, duration, now=now)
+        self.amount = 0.0
+        self.frames = [ FrameBuffer(num_leds), FrameBuffer(num_leds) ]
+
+
+    def effects(self):
+        effects = []
+        for channel_effect in self.outgoing:
+            if channel_effect not in effects:
+                effects.append(channel_effect)
+        return effects
+
+
+    def update(self, now=None):
+        ''' Move the crossfade along. Returns False once it's done. '''
+
+        self.amount = self.fade.value(now)
+        return self.amount < 1.0
+
+
+    def apply(self, source, index):
+        ''' The frame strip index shows: its outgoing effect's frame with source faded in over it '''
+
+        frame = self.frames[index]
+        frame.set_frame(self.outgoing[index].frame.pixels)
+        blend("mix", frame, source, self.amount)
+        return frame